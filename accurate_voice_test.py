@@ -1,25 +1,38 @@
 #!/usr/bin/env python3
 """
 More accurate voice latency test based on the actual app.py implementation.
-The TTS call happens BEFORE the HTTP response, so voice starts during the response time.
+/chat with "speak" returns once the full text reply is generated. Speech runs
+on the server in the background (SpeechQueue): each sentence is synthesised
+as soon as the LLM finishes it and played in order, without delaying the HTTP
+response. What is measured is that response time; voice start is estimated.
 """
 
 import time
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from datetime import datetime
 
+# One pooled keep-alive session for every request, so handshake cost is not
+# counted as voice latency
+SESSION = requests.Session()
+SESSION.trust_env = False
+SESSION.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
 def test_actual_voice_latency(message: str, mode: str = "conversation", num_tests: int = 3):
     """
     Test the actual voice latency based on app.py behavior:
     1. Message sent
-    2. AI generates response + TTS starts (in parallel)
-    3. HTTP response returned
+    2. AI streams the reply; each finished sentence is queued for TTS
+    3. HTTP response returned once the text is complete; playback carries on
     
-    So the voice starts somewhere during the HTTP response time.
+    Voice starts after the first sentence has been generated and synthesised.
+    That is usually inside the HTTP response time, but it is not observed here,
+    so it is estimated as a fraction of that time.
     """
     print(f"\n🎯 Testing: '{message}' in {mode} mode")
-    print("Note: Voice starts during HTTP response time (not after)")
+    print("Note: Voice start is estimated; speech plays in the background on the server")
     
     results = []
     
@@ -30,10 +43,9 @@ def test_actual_voice_latency(message: str, mode: str = "conversation", num_test
         print(f"⏰ Message sent at: {start_time:.3f}")
         
         try:
-            response = requests.post(
+            response = SESSION.post(
                 "http://localhost:5000/chat",
-                json={"message": message, "mode": mode},
-                headers={"Content-Type": "application/json"},
+                json={"message": message, "mode": mode, "speak": True},
                 timeout=30
             )
             
@@ -50,7 +62,7 @@ def test_actual_voice_latency(message: str, mode: str = "conversation", num_test
                 print(f"📄 Response: '{response_text[:50]}{'...' if len(response_text) > 50 else ''}'")
                 
                 if audio_enabled:
-                    # Based on app.py, TTS starts during the response generation
+                    # Based on app.py, TTS starts once the first sentence is generated
                     # Estimate when TTS actually started (likely 80-90% through the response time)
                     estimated_tts_start = start_time + (total_time * 0.85)
                     tts_latency = estimated_tts_start - start_time
@@ -86,7 +98,7 @@ def main():
     
     # Health check
     try:
-        health = requests.get("http://localhost:5000/health", timeout=5)
+        health = SESSION.get("http://localhost:5000/health", timeout=5)
         if health.status_code != 200:
             print("❌ Server not responding")
             return
@@ -149,7 +161,7 @@ def main():
         with open(filename, 'w') as f:
             json.dump({
                 "timestamp": datetime.now().isoformat(),
-                "note": "TTS starts during HTTP response generation, not after",
+                "note": "Voice start estimated from HTTP response time; speech plays asynchronously via SpeechQueue",
                 "results": all_results
             }, f, indent=2)
         print(f"\n💾 Results saved to: {filename}")
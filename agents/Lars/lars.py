@@ -1,8 +1,14 @@
 from pathlib import Path
+import concurrent.futures
 import json
-from typing import List
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
 
-from agents.profile_base import ProfileAgent
+from agents.profile_base import ProfileAgent, read_json_cached
+from core import utterance_utils
+from core.background import BackgroundQueue
 
 # Optional Mem0 dependency
 try:
@@ -11,56 +17,92 @@ try:
 except ImportError:
     MEM0_AVAILABLE = False
 
+# Optional faiss dependency; the agent's blocked numpy scan is used without it
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# Mem0 searches run on a small pool and are hedged against local retrieval;
+# the semaphore caps searches still in flight after a timeout
+MEM0_HEDGE_TIMEOUT = 0.4
+_RETRIEVAL_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+_MEM0_SEARCH_SLOTS = threading.BoundedSemaphore(4)
+
+def _mem0_http_client():
+    """httpx client for Mem0: pooled keep-alive, HTTP/2 when `h2` is installed."""
+    import httpx
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60),
+        timeout=httpx.Timeout(300.0, connect=5.0),
+    )
+
+
+def _mem0_add(items: list) -> None:
+    for client, messages, metadata in items:
+        try:
+            result = client.add(messages, user_id="lars", metadata=metadata)
+            print(f"[Lars] Added memory to Mem0 Pro: {result}")
+        except Exception as e:
+            print(f"[Lars] Error adding memory to Mem0 Pro: {e}")
+
+
+# Single-memory Mem0 adds are fire-and-forget: one daemon thread drains them
+# so a slow Mem0 never stalls the caller
+_MEM0_WRITES = BackgroundQueue("lars-mem0-writes", _mem0_add, maxsize=256)
+
+
 # File paths for Lars profile data
 AGENT_DIR = Path(__file__).resolve().parent
 MEM_PATH = AGENT_DIR / "memories.json"
 PERSONA_PATH = AGENT_DIR / "persona.json"
 UTTERANCE_PATH = AGENT_DIR / "utterance.json"
 
-# Load persona data
-if PERSONA_PATH.exists():
-    _persona_data = json.loads(PERSONA_PATH.read_text(encoding="utf-8"))
-else:
-    _persona_data = {"description": "", "personality_type": ""}
-
-# Load utterance data
-if UTTERANCE_PATH.exists():
-    _utterance_data = json.loads(UTTERANCE_PATH.read_text(encoding="utf-8"))
-else:
-    _utterance_data = {"style_guide": "", "sample_phrases": []}
-
-PERSONA_DESCRIPTION = _persona_data.get("description", "")
-PERSONALITY_TYPE = _persona_data.get("personality_type", "")
-STYLE_GUIDE = _utterance_data.get("style_guide", "")
-SAMPLE_PHRASES = _utterance_data.get("sample_phrases", [])
-
-# Build SEED_MEMORIES for backwards compatibility
-SEED_MEMORIES = []
-if MEM_PATH.exists():
-    mem_list = json.loads(MEM_PATH.read_text(encoding="utf-8"))
-    for m in mem_list:
-        if isinstance(m, dict):
-            memory_text = m.get("memory", "")
-            if memory_text:
-                SEED_MEMORIES.append(memory_text)
+
+def _load_profile() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Read persona and utterance data on first use rather than at import."""
+    # Parsed once per file change; repeat loads are a cache lookup
+    persona_data = read_json_cached(PERSONA_PATH, {"description": "", "personality_type": ""})
+    utterance_data = read_json_cached(UTTERANCE_PATH, {"style_guide": "", "sample_phrases": []})
+    return persona_data, utterance_data
 
 
 class Lars(ProfileAgent):
     transcript_path = UTTERANCE_PATH  # Now points to utterance.json
-    persona = PERSONA_DESCRIPTION
 
     def __init__(self) -> None:
+        persona_data, utterance_data = _load_profile()
+        self.persona = persona_data.get("description", "")
+        self.sample_phrases = utterance_data.get("sample_phrases", [])
+        personality_type = persona_data.get("personality_type", "")
+        style_guide = utterance_data.get("style_guide", "")
+        
         # Combine persona description with utterance style for rich personality
-        full_personality = f"{PERSONA_DESCRIPTION}\n\nCommunication Style: {STYLE_GUIDE}"
-        if PERSONALITY_TYPE:
-            full_personality += f" (Personality Type: {PERSONALITY_TYPE})"
+        full_personality = f"{self.persona}\n\nCommunication Style: {style_guide}"
+        if personality_type:
+            full_personality += f" (Personality Type: {personality_type})"
         
         super().__init__(name="Lars", personality=full_personality, tts_voice_id="5epn2vbuws8S5MRzxJH8")
         
+        # Prompt personality with utterance patterns; fixed after init, so built once
+        self._enhanced_personality = f"{self.personality}\n\nSpeech Patterns: Use phrases like: {', '.join(self.sample_phrases[:5])}"
+        
         # Load memories from Mem0 with proper error handling
         print("[Lars] Lars initialized successfully")
         self._memories_loaded = False
         self._mem0_client = None
+        self._mem0_setup_failed = False
+        
+        # faiss mirror of the agent's embedding matrix, for `self._faiss_src`
+        self._faiss_index = None
+        self._faiss_src: Optional[list] = None
 
     def _load_mem0_memories(self) -> bool:
         """Load memories from Mem0 if available."""
@@ -75,14 +117,16 @@ class Lars(ProfileAgent):
             
             if all_memories and len(all_memories) > 0:
                 print(f"[Lars] Found {len(all_memories)} memories in Mem0")
+                texts = []
                 for memory in all_memories:
                     if isinstance(memory, dict):
                         memory_text = memory.get('memory', memory.get('text', ''))
                         if memory_text:
-                            # Use local add_memory to avoid recursive Mem0 calls during loading
-                            self._add_memory_local_only(memory_text)
+                            texts.append(memory_text)
                     elif isinstance(memory, str):
-                        self._add_memory_local_only(memory)
+                        texts.append(memory)
+                # Use local-only adds to avoid recursive Mem0 calls during loading
+                self._add_memories_local_only(texts)
                 return True
             else:
                 print("[Lars] No memories found in Mem0")
@@ -94,81 +138,119 @@ class Lars(ProfileAgent):
 
     def _add_memory_local_only(self, text: str):
         """Add memory to local storage only (no Mem0 sync during loading)."""
-        from core.agent import Memory, _EMBEDDER
-        import time
+        self._add_memories_local_only([text])
+
+    def _add_memories_local_only(self, texts: List[str]) -> None:
+        """Add several memories locally, embedding them in one batched encode."""
+        if not texts:
+            return
+        # Seeds repeat across restarts: only texts missing from the cache are encoded
+        self._add_embedded_memories(texts, self._encode(texts))
+
+    def _sync_faiss_index(self, codes: np.ndarray) -> None:
+        """Add new rows of *codes* to the faiss index; rebuild if rows were dropped."""
+        from core.agent import EMB_SCALE
         
-        emb = _EMBEDDER.encode(text)
-        if hasattr(emb, "tolist"):
-            emb = emb.tolist()
-        else:
-            emb = list(emb)
+        index = self._faiss_index
+        if index is None or self._faiss_src is not self.memory or index.ntotal > len(codes):
+            # 8-bit codes over [-1, 1], the same grid the agent stores rows on
+            dim = codes.shape[1]
+            index = faiss.IndexScalarQuantizer(
+                dim, faiss.ScalarQuantizer.QT_8bit_uniform, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(np.stack([np.ones(dim), -np.ones(dim)]).astype(np.float32))
+            self._faiss_index, self._faiss_src = index, self.memory
+        if index.ntotal < len(codes):
+            index.add(codes[index.ntotal:].astype(np.float32) / EMB_SCALE)
+
+    def _retrieve_local(self, query: str, top_k: int) -> List[str]:
+        """Nearest-neighbour search over the local matrix by cosine similarity."""
+        codes = self.embedding_codes()
+        # The faiss index is a flat scan; past ANN_MIN_ROWS the agent's HNSW wins
+        if not FAISS_AVAILABLE or not len(codes) or top_k <= 0 or self._use_ann(len(codes)):
+            return super().retrieve_memories(query, top_k)
         
-        mem = Memory(
-            text=text,
-            timestamp=time.time(),
-            embedding=emb,
-            is_summary=False,
-        )
-        self.memory.append(mem)
-        self._update_graph(text)
+        self._sync_faiss_index(codes)
+        _, ids = self._faiss_index.search(self._query_vec(query)[None, :], min(top_k, len(codes)))
+        return [self.memory[i].text for i in ids[0] if i >= 0]
 
     def _load_local_memories(self) -> None:
         """Load memories from local memories.json file."""
-        if MEM_PATH.exists():
-            mem_list = json.loads(MEM_PATH.read_text(encoding="utf-8"))
+        mem_list = read_json_cached(MEM_PATH)
+        if mem_list is not None:
             print(f"[Lars] Loading {len(mem_list)} memories from local file")
-            for m in mem_list:
-                if isinstance(m, dict):
-                    memory_text = m.get("memory", "")
+            texts = [m.get("memory", "") for m in mem_list if isinstance(m, dict)]
+            self._add_memories_local_only([t for t in texts if t])
+            # One sync for the whole batch instead of one every few adds
+            self.sync_memories()
+
+    def _search_mem0(self, client, query: str, top_k: int) -> List[str]:
+        """Search Lars' Mem0 memories and return their texts."""
+        results: List[str] = []
+        search_results = client.search(query, user_id="lars", limit=top_k)
+        if search_results:
+            for result in search_results:
+                if isinstance(result, dict):
+                    memory_text = result.get('memory', result.get('text', ''))
                     if memory_text:
-                        self.add_memory(memory_text)
+                        results.append(memory_text)
+                elif isinstance(result, str):
+                    results.append(result)
+        return results
 
     def retrieve_memories(self, query: str, top_k: int = 5) -> List[str]:
-        """Retrieve memories using Mem0 Pro client or local fallback."""
-        results: List[str] = []
-        
-        # Try Mem0 first
+        """Retrieve memories using Mem0 Pro client or local fallback.
+
+        The Mem0 search is hedged: it runs in the background while local
+        retrieval runs here, and local results are used if Mem0 has nothing
+        or hasn't answered within MEM0_HEDGE_TIMEOUT seconds.
+        """
         client = self._get_mem0_client()
-        if client:
-            try:
-                # Search memories for Lars
-                search_results = client.search(query, user_id="lars", limit=top_k)
-                
-                if search_results:
-                    for result in search_results:
-                        if isinstance(result, dict):
-                            memory_text = result.get('memory', result.get('text', ''))
-                            if memory_text:
-                                results.append(memory_text)
-                        elif isinstance(result, str):
-                            results.append(result)
-                            
-            except Exception as e:
-                print(f"[Lars] Mem0 search failed: {e}, using local memories")
+        if not client or not _MEM0_SEARCH_SLOTS.acquire(blocking=False):
+            return self._retrieve_local(query, top_k)
+        
+        deadline = time.monotonic() + MEM0_HEDGE_TIMEOUT
+        mem0_future = _RETRIEVAL_POOL.submit(self._search_mem0, client, query, top_k)
+        mem0_future.add_done_callback(lambda _: _MEM0_SEARCH_SLOTS.release())
+        
+        local_results = self._retrieve_local(query, top_k)
+        
+        results: List[str] = []
+        try:
+            results = mem0_future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            mem0_future.cancel()
+            print("[Lars] Mem0 search too slow, using local memories")
+        except Exception as e:
+            print(f"[Lars] Mem0 search failed: {e}, using local memories")
         
         # Fallback to local retrieval if Mem0 fails or no results
-        if not results:
-            results = super().retrieve_memories(query, top_k)
-            
-        return results
+        return results or local_results
 
     def _get_mem0_client(self):
-        """Get or create Mem0 client with graph memory enabled."""
-        if self._mem0_client is None and MEM0_AVAILABLE:
+        """Get or create Mem0 client with graph memory enabled.
+
+        Setup is attempted once: `MemoryClient()` validates the key with a
+        network round-trip, so a failed or unconfigured setup is remembered
+        instead of being retried on every retrieval.
+        """
+        if self._mem0_client is None and MEM0_AVAILABLE and not self._mem0_setup_failed:
+            self._mem0_setup_failed = True
             try:
                 from config import MEM0_API_KEY, MEM0_ORG_ID, MEM0_PROJECT_ID
                 if not all([MEM0_API_KEY, MEM0_ORG_ID, MEM0_PROJECT_ID]):
                     print("[Lars] Mem0 credentials not found in config")
                     return None
                 
-                # Initialize Mem0 Pro client
-                self._mem0_client = MemoryClient(
-                    api_key=MEM0_API_KEY,
-                    org_id=MEM0_ORG_ID,
-                    project_id=MEM0_PROJECT_ID
-                )
+                # Initialize Mem0 Pro client on a pooled keep-alive transport
+                kwargs = dict(api_key=MEM0_API_KEY, org_id=MEM0_ORG_ID, project_id=MEM0_PROJECT_ID)
+                try:
+                    self._mem0_client = MemoryClient(client=_mem0_http_client(), **kwargs)
+                except TypeError:  # older SDKs build their own httpx client
+                    self._mem0_client = MemoryClient(**kwargs)
+                self._mem0_setup_failed = False
                 
-                # Check if graph memory is enabled (simplified check)
+                # Graph memory is a project setting; no extra request to confirm it
                 print(f"[Lars] Mem0 client initialized (graph memory: enabled)")
             except ImportError:
                 print("[Lars] Mem0 credentials not found")
@@ -192,67 +274,39 @@ class Lars(ProfileAgent):
                 print(f"[Lars] Error loading memories: {e}")
                 self._memories_loaded = True  # Don't keep trying
 
-    def generate_response(self, user_msg: str, *, model: str = "gpt-4o-mini", mode: str = "conversation") -> str:
-        """Generate response using Lars' specific style and Mem0 memories."""
-        # Add user message to conversation context
-        self.add_to_context("user", user_msg)
-        
-        # Get conversation context
-        context_string = self.get_context_string()
-        
-        # Retrieve relevant memories (this will use Mem0 if available)
-        retrieved_memories = "\n".join(self.retrieve_memories(user_msg))
-        
-        # Combine context with retrieved memories, prioritizing recent context
-        if context_string and retrieved_memories:
-            relevant = f"Recent conversation:\n{context_string}\n\nRelevant memories:\n{retrieved_memories}"
-        elif context_string:
-            relevant = f"Recent conversation:\n{context_string}"
-        else:
-            relevant = retrieved_memories
-        
-        # Get graph context
-        graph_info = ", ".join(self.graph_context(user_msg))
+    def _utterance_kwargs(self, user_msg: str, *, model: str, mode: str) -> Dict[str, Any]:
+        """Use Lars' specific style and Mem0 memories for the reply prompt."""
+        # Retrieval goes through Lars.retrieve_memories, so Mem0 is used if available
+        kwargs = super()._utterance_kwargs(user_msg, model=model, mode=mode)
         
         # Enhanced prompt that incorporates utterance patterns
-        enhanced_personality = f"{self.personality}\n\nSpeech Patterns: Use phrases like: {', '.join(SAMPLE_PHRASES[:5])}"
-        
-        # Import utterance utils for response generation
-        from core import utterance_utils
-        
-        response = utterance_utils.generate_utterance(
-            agent_name=self.name,
-            personality=enhanced_personality,
-            user_msg=user_msg,
-            relevant=relevant,
-            graph_info=graph_info,
-            model=model,
-            temperature=0.8,
-            mode=mode,
-        )
-        
+        kwargs["personality"] = self._enhanced_personality
+        kwargs["temperature"] = 0.8
+        return kwargs
+
+    def _remember_exchange(self, user_msg: str, response: str) -> None:
         # Add response to conversation context
         self.add_to_context("agent", response)
         
         # Note: We don't automatically store conversations in memory anymore
-        # The user will be asked at the end of the chat if they want to save to Mem0
-        return response
+        # Mem0 uploads are opt-in: /save-conversation with upload_to_mem0
     
     def add_memory_to_mem0(self, text: str, metadata: dict = None) -> bool:
-        """Add memory to Mem0 Pro with graph relationships enabled."""
+        """Queue a memory for Mem0 Pro (graph relationships enabled).
+
+        Returns once the memory is queued; the add itself runs on a
+        background thread and failures are logged there.
+        """
         client = self._get_mem0_client()
         if not client:
             return False
         
-        try:
-            # Format as message list for Mem0 Pro API
-            messages = [{"role": "user", "content": text}]
-            result = client.add(messages, user_id="lars", metadata=metadata)
-            print(f"[Lars] Added memory to Mem0 Pro: {result}")
+        # Format as message list for Mem0 Pro API
+        messages = [{"role": "user", "content": text}]
+        if _MEM0_WRITES.put((client, messages, metadata)):
             return True
-        except Exception as e:
-            print(f"[Lars] Error adding memory to Mem0 Pro: {e}")
-            return False
+        print("[Lars] Mem0 write queue full, dropping memory")
+        return False
     
     def get_memory_graph(self) -> dict:
         """Get the memory graph for Lars from Mem0 Pro."""
@@ -301,9 +355,8 @@ Format your response as a JSON object:
 }}
 """
 
-        from core import utterance_utils
+        # generate_profile builds a tiktoken encoding on import; keep it lazy
         from generate_profile import clean_json_response
-        import json
         
         try:
             raw_reflection = utterance_utils.generate_utterance(
@@ -329,4 +382,12 @@ Format your response as a JSON object:
             return {"reflection": "Reflection generation failed", "new_insights": [], "topics_to_explore": [], "user_observations": ""}
 
 
-lars = Lars()
+_lars: Optional[Lars] = None
+
+
+def get_lars() -> Lars:
+    """Return the shared Lars instance, creating it on first use."""
+    global _lars
+    if _lars is None:
+        _lars = Lars()
+    return _lars
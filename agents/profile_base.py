@@ -1,10 +1,31 @@
 from __future__ import annotations
 
+import functools
 from pathlib import Path
+from typing import Any
+
+import orjson
 
 from core.agent import Agent
 
 
+@functools.lru_cache(maxsize=32)
+def _cached_json(path_str: str, mtime: float) -> Any:
+    return orjson.loads(Path(path_str).read_bytes())
+
+
+def read_json_cached(path: Path, default: Any = None) -> Any:
+    """Parse *path* once per modification; *default* if it doesn't exist.
+
+    The returned object is shared between callers, so treat it as read-only.
+    """
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return default
+    return _cached_json(str(path), mtime)
+
+
 class ProfileAgent(Agent):
     """Agent with convenience helpers for transcripts and persona."""
 
@@ -3,26 +3,56 @@ import os
 # Set tokenizers environment variable before any imports that might use it
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'
 
-import json
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template
+import orjson
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_sock import Sock
-import json
+import asyncio
+import atexit
+import contextlib
+import logging
+import mmap
+from logging.handlers import QueueHandler, QueueListener
+import queue
 import threading
 import time
 from collections import defaultdict
+from dataclasses import dataclass, replace
+from typing import Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
 
-# Agents
-from agents.Lars.lars import lars
+# Optional MessagePack support for inbound /ws control frames
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Agents (factories, so only agents actually used get loaded)
+from agents.Lars.lars import get_lars
+from core import llm_utils
+from core.background import BackgroundQueue
+from core.tts_utils import AudioCache
 
 AGENTS = {
-    "lars": lars,
+    "lars": get_lars,
 }
 
+class OrjsonProvider(JSONProvider):
+    """Route request parsing and jsonify() through orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # Initialize Flask app with WebSocket support
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, 
      origins=["*"],
      allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
@@ -30,38 +60,198 @@ CORS(app,
 )  # Enable CORS for Unreal Engine integration
 sock = Sock(app)
 
-# Global state
-current_agent = lars
-conversation_history = []
-tts_manager = None  # Will be initialized when needed
+@dataclass(frozen=True)
+class State:
+    """Active agent plus the unsaved turns of the current session."""
+    agent: Any
+    history: Tuple[dict, ...] = ()
+
+
+# Global state: STATE is replaced (never mutated) under _STATE_LOCK, so
+# readers just take `s = STATE` once and use it without locking
+STATE = State(agent=AGENTS["lars"]())
+_STATE_LOCK = threading.Lock()
+MAX_LIVE_HISTORY = 200  # unsaved turns kept before they're flushed as a session
 active_connections = {}  # Track active WebSocket connections
-connection_flags = defaultdict(dict)  # Per-connection cancellation flags
+connection_flags = defaultdict(dict)  # Per-connection state (running TTS futures)
+SAVE_POOL = ThreadPoolExecutor(max_workers=2)  # Reflection + history writes off the request path
+atexit.register(SAVE_POOL.shutdown, wait=True)  # flush queued saves on exit
+app.config["TTS_OK"] = False  # set per agent by load_agent()
+
+
+def _record_turn(agent, entry: dict) -> None:
+    """Append a turn to the session history if *agent* is still active.
+
+    Once the live history reaches MAX_LIVE_HISTORY turns it is detached and
+    saved as a session, which bounds both memory and the copy-on-write cost
+    of each append, and limits what a crash could lose.
+    """
+    global STATE
+    full = ()
+    with _STATE_LOCK:
+        if STATE.agent is agent:
+            history = STATE.history + (entry,)
+            if len(history) >= MAX_LIVE_HISTORY:
+                full, history = history, ()
+            STATE = replace(STATE, history=history)
+    if full:
+        SAVE_POOL.submit(save_conversation_history, agent, list(full)).add_done_callback(_log_save_failure)
+
+
+def _take_history() -> State:
+    """Atomically detach the unsaved history; returns the state it came from."""
+    global STATE
+    with _STATE_LOCK:
+        taken = STATE
+        STATE = replace(STATE, history=())
+    return taken
+
+
+def _save_on_exit() -> None:
+    """Save whatever is left of the live session, with its reflection."""
+    taken = _take_history()
+    if taken.history:
+        save_conversation_history(taken.agent, list(taken.history), reflect=True)
+
+
+# Registered after SAVE_POOL's shutdown, so it runs first (atexit is LIFO)
+atexit.register(_save_on_exit)
+
+
+# WebSocket/TTS logging goes through a queue so request and stream threads
+# never block on stdout; the listener thread writes it out
+logger = logging.getLogger("augtwins.ws")
+logger.setLevel(os.environ.get("WS_LOG_LEVEL", "INFO"))
+logger.propagate = False
+_ws_log_queue: "queue.Queue" = queue.Queue(-1)
+logger.addHandler(QueueHandler(_ws_log_queue))
+_ws_log_handler = logging.StreamHandler()
+_ws_log_handler.setFormatter(logging.Formatter("[WebSocket] %(message)s"))
+_ws_log_listener = None
+
+
+def start_worker_services() -> None:
+    """Start per-process background threads (TTS loop, log listener).
+
+    Call once per serving process; threads don't survive a fork, so under
+    gunicorn this runs in each worker rather than the preloading master.
+    """
+    global _ws_log_listener
+    from core import tts_utils
+    tts_utils.get_tts_loop()
+    if _ws_log_listener is None:
+        _ws_log_listener = QueueListener(_ws_log_queue, _ws_log_handler)
+        _ws_log_listener.start()
+        atexit.register(_ws_log_listener.stop)
+
+
+def _log_save_failure(future) -> None:
+    """Report background history-save errors in the server log."""
+    if future.exception():
+        print(f"[History save error] {future.exception()}")
 
 
 def load_agent(agent) -> None:
     """Load agent - memories are now handled by individual agents"""
+    migrate_legacy_history(agent.name)
     # Force memory loading during startup to avoid first-response latency
     if hasattr(agent, '_ensure_memories_loaded'):
         print(f"[{agent.name}] Loading memories during startup...")
         agent._ensure_memories_loaded()
+    # Pay the embedder's first-call init (single and batched paths) and the
+    # retrieval code path here rather than on the first user message
+    from core.agent import _embedder
+    start = time.perf_counter()
+    _embedder().encode(["warmup"] * 8, batch_size=8)  # also loads the model
+    agent.retrieve_memories("warmup", top_k=1)
+    print(f"[{agent.name}] Warmup done in {time.perf_counter() - start:.2f}s")
+    # Probe TTS once per agent so requests can report audio up front
+    from core import tts_utils
+    app.config["TTS_OK"] = tts_utils.probe_voice(getattr(agent, 'tts_voice_id', ''))
+    start_worker_services()  # start the /ws streaming loop now, not on the first prompt
+    # Open the OpenAI connection pool now so the first chat doesn't pay for TLS
+    if llm_utils.warm_up():
+        print(f"[{agent.name}] OpenAI connection warmed up")
+
+
+def _history_path(agent_name: str) -> Path:
+    """Return the append-only JSONL history file for *agent_name*."""
+    return Path(f"agents/{agent_name.title()}") / "conversation_history.jsonl"
+
+
+def migrate_legacy_history(agent_name: str) -> None:
+    """One-shot: move a legacy ``conversation_history.json`` array into the JSONL log."""
+    legacy = _history_path(agent_name).with_suffix(".json")
+    if not legacy.exists():
+        return
+    try:
+        sessions = orjson.loads(legacy.read_bytes())
+    except orjson.JSONDecodeError as e:
+        print(f"[{agent_name}] Could not migrate {legacy}: {e}")
+        return
+    with _history_path(agent_name).open("ab") as f:
+        for session in sessions:
+            f.write(orjson.dumps(session, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS))
+    legacy.rename(legacy.with_suffix(".json.migrated"))
+    print(f"[{agent_name}] Migrated {len(sessions)} sessions to {_history_path(agent_name).name}")
+
+
+def iter_conversation_history(agent_name: str):
+    """Yield saved sessions for *agent_name*, oldest first, one line at a time."""
+    history_file = _history_path(agent_name)
+    if not history_file.exists():
+        return
+    with history_file.open("rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
 
 
-def save_conversation_history(agent, conversations: list) -> None:
-    """Save conversation history to agent's directory with reflection."""
-    agent_dir = Path(f"agents/{agent.name.title()}")
-    history_file = agent_dir / "conversation_history.json"
+def recent_conversation_history(agent_name: str, limit: int) -> list:
+    """Return the last *limit* sessions, oldest first, without reading the whole log.
+
+    The file is memory-mapped and scanned backwards for line breaks, so only
+    the requested tail is ever parsed.
+    """
+    history_file = _history_path(agent_name)
+    if limit <= 0 or not history_file.exists() or history_file.stat().st_size == 0:
+        return []
+    sessions = []
+    with history_file.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm)
+        while end > 0 and len(sessions) < limit:
+            start = mm.rfind(b"\n", 0, end - 1) + 1
+            line = mm[start:end].strip()
+            if line:
+                sessions.append(orjson.loads(line))
+            end = start
+    sessions.reverse()
+    return sessions
+
+
+def _iso(ts) -> str:
+    """Format a ``time.time_ns()`` stamp as ISO-8601; pass strings through."""
+    return datetime.fromtimestamp(ts / 1e9).isoformat() if isinstance(ts, int) else ts
+
+
+def save_conversation_history(agent, conversations: list, *, reflect: bool = False,
+                              upload: bool = False) -> None:
+    """Append this session to the agent's history log.
+
+    The LLM reflection only runs with *reflect* (agent switch or exit);
+    mid-session saves are plain appends with ``"reflection": null``.
+    The session goes to Mem0 only with *upload*, i.e. when the user opted in.
+    """
+    history_file = _history_path(agent.name)
     
-    # Load existing history
-    existing_history = []
-    if history_file.exists():
-        try:
-            existing_history = json.loads(history_file.read_text(encoding="utf-8"))
-        except Exception:
-            existing_history = []
+    # Queue an opted-in Mem0 upload first: its worker thread sends it while
+    # the reflection below waits on the LLM, so the two round-trips overlap
+    if upload:
+        save_new_memories_to_mem0(agent, conversations)
     
     # Generate reflection on the conversation
     reflection = None
-    if hasattr(agent, 'reflect_on_conversation') and conversations:
+    if reflect and hasattr(agent, 'reflect_on_conversation') and conversations:
         print(f"[{agent.name}] Generating reflection on conversation...")
         try:
             reflection = agent.reflect_on_conversation(conversations)
@@ -71,13 +261,13 @@ def save_conversation_history(agent, conversations: list) -> None:
     # Add new conversations with timestamp and reflection
     session = {
         "timestamp": datetime.now().isoformat(),
-        "conversations": conversations,
+        "conversations": [{**c, "timestamp": _iso(c.get("timestamp", ""))} for c in conversations],
         "reflection": reflection
     }
-    existing_history.append(session)
     
-    # Save updated history
-    history_file.write_text(json.dumps(existing_history, indent=2, ensure_ascii=False))
+    # One line per session: earlier sessions are never re-read or rewritten
+    with history_file.open("ab") as f:
+        f.write(orjson.dumps(session, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS))
     print(f"[Conversation history saved for {agent.name}]")
     
     if reflection and isinstance(reflection, dict):
@@ -88,15 +278,32 @@ def save_conversation_history(agent, conversations: list) -> None:
             print(f"[{agent.name}] Topics to explore: {', '.join(reflection['topics_to_explore'][:2])}...")
 
 
+def _mem0_writer(items: list) -> None:
+    """Group queued conversations by agent and upload each group."""
+    grouped = {}
+    for agent, conversations in items:
+        grouped.setdefault(id(agent), (agent, []))[1].extend(conversations)
+    for agent, conversations in grouped.values():
+        _upload_to_mem0(agent, conversations)
+
+
+# Mem0 writes are queued and coalesced by one background worker, so several
+# quick saves become a single add() per agent instead of one round-trip each
+MEM0_Q = BackgroundQueue("mem0-writer", _mem0_writer, maxsize=256, max_items=32, linger=2.0)
+
+
 def save_new_memories_to_mem0(agent, conversations: list) -> None:
+    """Queue a conversation for upload to Mem0 (see `_mem0_writer`)."""
+    if conversations and not MEM0_Q.put((agent, list(conversations))):
+        print(f"[{agent.name}] Mem0 upload queue full, dropping conversation")
+
+
+def _upload_to_mem0(agent, conversations: list) -> None:
     """Save new memories from conversation to Mem0.
 
     Sends the full conversation as role-tagged messages so Mem0 can
     perform its own memory extraction in a single request.
     """
-    if not conversations:
-        return
-    
     print(f"[{agent.name}] Saving new memories to Mem0...")
     
     try:
@@ -112,10 +319,14 @@ def save_new_memories_to_mem0(agent, conversations: list) -> None:
                         if conv.get("agent"):
                             messages.append({"role": "assistant", "content": conv.get("agent", "")})
 
+                    # Mem0 takes one metadata dict per add, so keep the span of the turns
                     metadata = {
+                        "type": "conversation",
                         "category": "conversation",
                         "source": "live_chat",
-                        "timestamp": conversations[-1].get('timestamp', ''),
+                        "turns": len(conversations),
+                        "started_at": _iso(conversations[0].get('timestamp', '')),
+                        "timestamp": _iso(conversations[-1].get('timestamp', '')),
                     }
 
                     client.add(messages, user_id=agent.name.lower(), metadata=metadata)
@@ -133,6 +344,12 @@ def save_new_memories_to_mem0(agent, conversations: list) -> None:
 
 # Flask Routes
 
+@app.before_request
+def _stamp_request() -> None:
+    """Read the clock once per request; handlers reuse ``g.now_ns``."""
+    g.now_ns = time.time_ns()
+
+
 @app.route('/')
 def index():
     """Serve the debugging frontend."""
@@ -140,8 +357,14 @@ def index():
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    """Handle chat messages from frontend or Unreal Engine."""
-    global current_agent, conversation_history
+    """Handle chat messages from frontend or Unreal Engine.
+
+    With ``"stream": true`` the reply is sent as Server-Sent Events, one
+    ``sentence`` event per completed sentence followed by a ``done`` event.
+    Adding ``"speak": true`` also voices the reply on the server; speech is
+    dispatched in the background so it never delays the HTTP response.
+    """
+    agent = STATE.agent
     
     data = request.get_json()
     message = data.get('message', '').strip()
@@ -150,31 +373,126 @@ def chat():
     if not message:
         return jsonify({'error': 'No message provided'}), 400
     
+    if data.get('stream'):
+        return Response(
+            stream_with_context(stream_chat_events(agent, message, mode, speak=bool(data.get('speak')) and app.config["TTS_OK"])),
+            mimetype='text/event-stream',
+        )
+    
     try:
-        # Generate response with mode
-        reply = current_agent.generate_response(message, mode=mode)
+        speak = bool(data.get('speak')) and app.config["TTS_OK"]
+        if speak:
+            # Voice each sentence as soon as the LLM finishes it, so speech
+            # overlaps the rest of generation instead of following it
+            from core.tts_utils import SpeechQueue
+            speech = SpeechQueue(agent.tts_voice_id)
+            full = []
+            try:
+                for sentence in _with_reply(agent.generate_response_stream(message, mode=mode), full):
+                    speech.put(sentence)
+            finally:
+                speech.close()  # playback of queued sentences continues
+            reply = full[0]
+        else:
+            reply = agent.generate_response(message, mode=mode)
         
         # Add to conversation history
         conversation_entry = {
             "user": message,
             "agent": reply,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": g.now_ns  # formatted only when written to disk
         }
-        conversation_history.append(conversation_entry)
+        _record_turn(agent, conversation_entry)
+        
+        audio_enabled = speak and bool(reply)
         
         return jsonify({
             'response': reply,
-            'agent': current_agent.name,
-            'timestamp': conversation_entry['timestamp']
+            'agent': agent.name,
+            'timestamp': conversation_entry['timestamp'],
+            'audio_enabled': audio_enabled
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _with_reply(stream, out: list):
+    """Yield *stream*'s sentences, then append its full reply text to *out*.
+
+    The sentences are stripped for speech; the reply keeps the LLM's own
+    whitespace, paragraph breaks and list formatting.
+    """
+    out.append((yield from stream))
+
+
+def stream_chat_events(agent, message: str, mode: str, *, speak: bool = False):
+    """Yield SSE frames for a streamed reply, optionally voicing each sentence."""
+    speech = None
+    if speak:
+        from core.tts_utils import SpeechQueue
+        speech = SpeechQueue(agent.tts_voice_id)
+    
+    full = []
+    try:
+        for sentence in _with_reply(agent.generate_response_stream(message, mode=mode), full):
+            if speech:
+                speech.put(sentence)
+            yield b"data: " + orjson.dumps({'type': 'sentence', 'text': sentence}) + b"\n\n"
+        
+        reply = full[0]
+        conversation_entry = {
+            "user": message,
+            "agent": reply,
+            "timestamp": time.time_ns()  # formatted only when written to disk
+        }
+        _record_turn(agent, conversation_entry)
+        
+        yield b"data: " + orjson.dumps({'type': 'done', 'response': reply, 'agent': agent.name, 'timestamp': conversation_entry['timestamp']}) + b"\n\n"
+    except Exception as e:
+        yield b"data: " + orjson.dumps({'type': 'error', 'error': str(e)}) + b"\n\n"
+    finally:
+        if speech:
+            speech.close()
+
+@app.route('/chat/audio', methods=['POST'])
+def chat_audio():
+    """Voice a reply as a chunked ``audio/mpeg`` stream.
+
+    Sentences from the LLM are piped into ElevenLabs' streaming WebSocket as
+    they are generated, so playback can begin before the reply is complete.
+    Use ``/chat`` with ``"stream": true`` for the matching text.
+    """
+    data = request.get_json()
+    message = data.get('message', '').strip()
+    mode = data.get('mode', 'conversation')
+    
+    if not message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    # Without TTS the stream would be empty and the LLM would never run
+    if not app.config["TTS_OK"]:
+        return jsonify({'error': 'Text-to-speech is unavailable'}), 503
+    
+    from core.tts_utils import stream_speech
+    agent = STATE.agent
+    
+    def sentences():
+        reply = yield from agent.generate_response_stream(message, mode=mode)
+        _record_turn(agent, {
+            "user": message,
+            "agent": reply,
+            "timestamp": time.time_ns()
+        })
+    
+    return Response(
+        stream_with_context(stream_speech(sentences(), agent.tts_voice_id)),
+        mimetype='audio/mpeg',
+    )
+
 @app.route('/switch-agent', methods=['POST'])
 def switch_agent():
     """Switch to a different agent."""
-    global current_agent, conversation_history
+    global STATE
     
     data = request.get_json()
     agent_name = data.get('agent', '').lower()
@@ -182,48 +500,78 @@ def switch_agent():
     if agent_name not in AGENTS:
         return jsonify({'error': f'Unknown agent: {agent_name}'}), 400
     
-    # Save current conversation history
-    if conversation_history:
-        save_conversation_history(current_agent, conversation_history)
-        conversation_history = []
+    # Load the new agent before swapping so chats keep working meanwhile
+    agent = AGENTS[agent_name]()
+    load_agent(agent)
+    with _STATE_LOCK:
+        previous = STATE
+        STATE = State(agent=agent)
     
-    # Clear conversation context for the current agent
-    current_agent.clear_context()
+    # Save the previous session in the background
+    if previous.history:
+        SAVE_POOL.submit(
+            save_conversation_history, previous.agent, list(previous.history), reflect=True
+        ).add_done_callback(_log_save_failure)
     
-    # Switch agent
-    current_agent = AGENTS[agent_name]
-    load_agent(current_agent)
+    # Clear conversation context for the previous agent
+    previous.agent.clear_context()
     
     return jsonify({
-        'current_agent': current_agent.name,
-        'message': f'Switched to {current_agent.name}'
+        'current_agent': agent.name,
+        'message': f'Switched to {agent.name}'
     })
 
 @app.route('/save-conversation', methods=['POST'])
 def save_conversation():
-    """Save current conversation history."""
-    global conversation_history
-    
-    if not conversation_history:
+    """Save current conversation history.
+
+    Send ``{"upload_to_mem0": true}`` to also upload the conversation to
+    Mem0; nothing is uploaded otherwise.
+    """
+    upload = bool((request.get_json(silent=True) or {}).get('upload_to_mem0'))
+    taken = _take_history()
+    if not taken.history:
         return jsonify({'message': 'No conversation to save'})
     
+    # Mid-session save: no reflection, and the append happens after responding
+    SAVE_POOL.submit(
+        save_conversation_history, taken.agent, list(taken.history), upload=upload
+    ).add_done_callback(_log_save_failure)
+    return jsonify({'status': 'queued', 'message': 'Conversation history queued for saving'}), 202
+
+@app.route('/history', methods=['GET'])
+def get_history():
+    """Return saved conversation sessions for an agent (default: current).
+
+    ``?limit=N`` returns only the most recent N sessions.
+    """
+    agent_name = request.args.get('agent', STATE.agent.name).lower()
+    if agent_name not in AGENTS:
+        return jsonify({'error': f'Unknown agent: {agent_name}'}), 400
+    limit = request.args.get('limit', type=int)
+    
     try:
-        save_conversation_history(current_agent, conversation_history)
-        conversation_history = []
-        return jsonify({'message': 'Conversation history saved successfully'})
+        if limit is not None:
+            sessions = recent_conversation_history(agent_name, limit)
+        else:
+            sessions = list(iter_conversation_history(agent_name))
+        return jsonify({
+            'agent': agent_name,
+            'sessions': sessions
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/clear-context', methods=['POST'])
 def clear_context():
     """Clear the current agent's conversation context."""
-    global current_agent
+    agent = STATE.agent
     
     try:
-        current_agent.clear_context()
+        agent.clear_context()
         return jsonify({
             'message': 'Conversation context cleared',
-            'agent': current_agent.name
+            'agent': agent.name
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -233,7 +581,7 @@ def get_agents():
     """Get list of available agents."""
     return jsonify({
         'agents': list(AGENTS.keys()),
-        'current_agent': current_agent.name
+        'current_agent': STATE.agent.name
     })
 
 @app.route('/health', methods=['GET'])
@@ -241,18 +589,16 @@ def health_check():
     """Health check endpoint for Unreal Engine integration."""
     return jsonify({
         'status': 'healthy',
-        'current_agent': current_agent.name,
-        'timestamp': datetime.now().isoformat()
+        'current_agent': STATE.agent.name,
+        'timestamp': _iso(g.now_ns)
     })
 
 @app.route('/unreal/tts', methods=['POST'])
 def unreal_tts():
     """Direct TTS endpoint for Unreal Engine (HTTP-based alternative)."""
-    global current_agent
-    
     data = request.get_json()
     text = data.get('text', '').strip()
-    voice_id = data.get('voice_id') or getattr(current_agent, 'tts_voice_id', '21m00Tcm4TlvDq8ikWAM')
+    voice_id = data.get('voice_id') or getattr(STATE.agent, 'tts_voice_id', '21m00Tcm4TlvDq8ikWAM')
     
     if not text:
         return jsonify({'error': 'No text provided'}), 400
@@ -266,20 +612,43 @@ def unreal_tts():
             'websocket_url': f'ws://{request.host}/ws',
             'sample_rate': 22050,
             'encoding': 'pcm_s16le',
+            'encodings': ['pcm_s16le', 'pcm_mulaw'],
+            'control_formats': ['json', 'msgpack'] if msgpack else ['json'],
             'channels': 1
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _decode_control(message) -> dict:
+    """Parse an inbound control frame: JSON text, or MessagePack/JSON binary.
+
+    Replies are always JSON text frames, since binary frames from the server
+    carry audio.
+    """
+    if msgpack and isinstance(message, (bytes, bytearray)):
+        try:
+            data = msgpack.unpackb(message, raw=False)
+        except Exception:
+            data = orjson.loads(message)
+    else:
+        data = orjson.loads(message)
+    if not isinstance(data, dict):
+        raise ValueError("control message must be an object")
+    return data
+
+
+def _send_json(ws, payload: dict) -> None:
+    """Send a control message to a WebSocket client as a text frame."""
+    ws.send(orjson.dumps(payload).decode())
+
 # WebSocket handler for real-time TTS streaming
 @sock.route('/ws')
 def websocket_handler(ws):
     """Handle plain WebSocket connections for Unreal Engine."""
     connection_id = id(ws)
     active_connections[connection_id] = ws
-    connection_flags[connection_id]['cancelled'] = False
     
-    print(f"[WebSocket] Client connected: {connection_id}")
+    logger.info("Client connected: %s", connection_id)
     
     try:
         while True:
@@ -289,139 +658,216 @@ def websocket_handler(ws):
             if message is None:
                 break
                 
-            print(f"[WebSocket] Received message from client {connection_id}: {message}")
+            logger.debug("Received message from client %s: %s", connection_id, message)
             try:
-                data = json.loads(message)
+                data = _decode_control(message)
                 message_type = data.get('type')
-                print(f"[WebSocket] Message type: '{message_type}' from client {connection_id}")
+                logger.debug("Message type %r from client %s", message_type, connection_id)
                 
                 if message_type == 'prompt':
                     handle_websocket_prompt(ws, data, connection_id)
                 elif message_type == 'cancel':
                     handle_websocket_cancel(ws, data, connection_id)
                 else:
-                    print(f"[WebSocket] Unknown message type '{message_type}' from client {connection_id}")
-                    ws.send(json.dumps({
+                    logger.warning("Unknown message type %r from client %s", message_type, connection_id)
+                    _send_json(ws, {
                         'type': 'error',
                         'error': f'Unknown message type: {message_type}'
-                    }))
+                    })
                     
-            except json.JSONDecodeError:
-                ws.send(json.dumps({
+            except ValueError:
+                _send_json(ws, {
                     'type': 'error',
-                    'error': 'Invalid JSON message'
-                }))
+                    'error': 'Invalid JSON message' if isinstance(message, str) else 'Invalid control message'
+                })
                 
     except Exception as e:
-        print(f"[WebSocket] Error for client {connection_id}: {e}")
+        logger.warning("Error for client %s: %s", connection_id, e)
     finally:
-        print(f"[WebSocket] Client disconnected: {connection_id}")
+        logger.info("Client disconnected: %s", connection_id)
         # Clean up connection
         if connection_id in active_connections:
             del active_connections[connection_id]
-        if connection_id in connection_flags:
-            del connection_flags[connection_id]
+        _cancel_tts_jobs(connection_flags.pop(connection_id, {}))
+
+AUDIO_CACHE = AudioCache()  # rendered PCM reused for repeated utterances
+WS_FRAME_BYTES = 16384  # merge PCM into frames of up to ~16 KB...
+WS_FRAME_WAIT = 0.02    # ...waiting at most 20 ms for more audio
+
+
+async def _ws_sender(client, send_q: asyncio.Queue) -> None:
+    """Drain *send_q* to *client*, merging queued PCM into larger frames.
+
+    Items are ``bytes`` (audio), ``str`` (a JSON control frame) or ``None``
+    (stop).  Audio that already fills a frame is sent as-is, without copying.
+    Socket writes block, so they run in the default executor rather than
+    stalling other jobs on the shared loop.
+    """
+    loop = asyncio.get_running_loop()
+    get, send = send_q.get, client.send
+    pending = None
+    while True:
+        item = pending if pending is not None else await get()
+        pending = None
+        if item is None:
+            return
+        if isinstance(item, bytes) and len(item) < WS_FRAME_BYTES:
+            buf = bytearray(item)
+            deadline = loop.time() + WS_FRAME_WAIT
+            while len(buf) < WS_FRAME_BYTES:
+                try:
+                    nxt = await asyncio.wait_for(get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if isinstance(nxt, bytes):
+                    buf += nxt
+                else:
+                    pending = nxt
+                    break
+            item = bytes(buf)
+        try:
+            await loop.run_in_executor(None, send, item)
+        except Exception as e:
+            logger.warning("Error sending audio chunk: %s", e)
+            return
+
 
 def handle_websocket_prompt(ws, data, connection_id):
     """Handle text prompt for TTS streaming."""
-    global current_agent, tts_manager
-    
     text = data.get('text', '').strip()
     
     if not text:
-        print(f"[WebSocket TTS] No text provided, sending error")
-        ws.send(json.dumps({
+        logger.debug("No text provided, sending error")
+        _send_json(ws, {
             'type': 'error',
             'error': 'No text provided'
-        }))
+        })
         return
     
-    # Initialize TTS manager if needed
-    if tts_manager is None:
-        print(f"[WebSocket TTS] Initializing TTS manager")
-        from core.tts_utils import get_tts_manager
-        tts_manager = get_tts_manager()
+    from core.tts_utils import PCM_ENCODINGS, get_tts_loop, pcm_encoder
+    
+    # µ-law halves the bytes on the wire; raw 16-bit PCM stays the default
+    encoding = data.get('encoding', 'pcm_s16le')
+    if encoding not in PCM_ENCODINGS:
+        _send_json(ws, {
+            'type': 'error',
+            'error': f'Unsupported encoding: {encoding} (use one of {", ".join(PCM_ENCODINGS)})'
+        })
+        return
     
     # Get agent's voice ID
-    voice_id = getattr(current_agent, 'tts_voice_id', '21m00Tcm4TlvDq8ikWAM')
-    job_id = data.get('id', f"job_{int(time.time() * 1000)}")
+    voice_id = getattr(STATE.agent, 'tts_voice_id', '21m00Tcm4TlvDq8ikWAM')
+    job_id = data.get('id') or f"job_{time.time_ns() // 1_000_000}"
     
     
     # Send audio_start JSON response
-    ws.send(json.dumps({
+    _send_json(ws, {
         'type': 'audio_start',
         'id': job_id,
-        'encoding': 'pcm_s16le',
+        'encoding': encoding,
         'sample_rate': 22050,
         'channels': 1
-    }))
+    })
     
-    def stream_audio():
-        """Stream audio in background thread."""
+    async def stream_audio():
+        """Stream audio for this job on the shared TTS loop."""
+        from core.tts_utils import RealtimeTTSManager
+        client = active_connections.get(connection_id)
+        if client is None:
+            return
+        # Bounded, so a slow client applies backpressure to the TTS stream
+        send_q: asyncio.Queue = asyncio.Queue(maxsize=64)
+        sender = asyncio.ensure_future(_ws_sender(client, send_q))
+        # ElevenLabs closes the socket after each end-of-input, so every job
+        # gets its own session; the loop and thread are what's reused
+        job_manager = RealtimeTTSManager()
+        encode = pcm_encoder(encoding)
+        cache_key = (text, voice_id)
+
+        async def put(item) -> bool:
+            """Queue *item* for the sender; False once the sender has stopped."""
+            if sender.done():  # client went away or a send failed
+                return False
+            if not send_q.full():
+                send_q.put_nowait(item)
+                return True
+            # Queue full: wait for room, but not past the sender's exit
+            put_task = asyncio.ensure_future(send_q.put(item))
+            try:
+                await asyncio.wait({put_task, sender}, return_when=asyncio.FIRST_COMPLETED)
+                return put_task.done()
+            finally:
+                put_task.cancel()
+
         try:
-            chunk_index = 0
-            for packet in tts_manager.stream_tts_sync(text, voice_id, job_id):
-                # Check cancellation flag
-                if connection_flags[connection_id].get('cancelled', False):
-                    break
-                    
-                if packet['type'] == 'audio_data':
-                    # Send binary PCM frames (4.4KB chunks for 100ms at 22.05kHz)
-                    chunk_data = packet['data']
-                    chunk_size = 4410  # ~100ms at 22.05kHz mono 16-bit
-                    
-                    for i in range(0, len(chunk_data), chunk_size):
-                        if connection_flags[connection_id].get('cancelled', False):
-                            break
-                            
-                        chunk = chunk_data[i:i + chunk_size]
-                        if chunk and connection_id in active_connections:
-                            try:
-                                # Send raw binary PCM data
-                                active_connections[connection_id].send(chunk)
-                                chunk_index += 1
-                            except Exception as e:
-                                print(f"[WebSocket] Error sending audio chunk: {e}")
+            cached = AUDIO_CACHE.get(cache_key)
+            if cached is not None:
+                # Same utterance already rendered: stream it from memory
+                for i in range(0, len(cached), WS_FRAME_BYTES):
+                    if not await put(encode(cached[i:i + WS_FRAME_BYTES])):
+                        break
+            else:
+                rendered = bytearray()
+                # Cancel arrives as CancelledError at the next await, so the
+                # loop itself needs no per-chunk checks
+                # aclosing: leaving the loop early closes the generator here,
+                # not at some later garbage collection
+                async with contextlib.aclosing(job_manager.stream_tts(text, voice_id, job_id)) as packets:
+                    async for packet in packets:
+                        if packet['type'] == 'audio_data':
+                            pcm = packet['data']
+                            if not await put(encode(pcm)):
                                 break
+                            rendered += pcm
+                        elif packet['type'] == 'audio_end' and packet.get('complete'):
+                            AUDIO_CACHE.put(cache_key, bytes(rendered))
             
-            # Send audio_end JSON response
-            if not connection_flags[connection_id].get('cancelled', False) and connection_id in active_connections:
-                active_connections[connection_id].send(json.dumps({
-                    'type': 'audio_end',
-                    'id': job_id
-                }))
+            # audio_end goes through the queue so it follows the last audio frame
+            if await put(orjson.dumps({'type': 'audio_end', 'id': job_id}).decode()) and await put(None):
+                await sender
                 
         except Exception as e:
-            print(f"[WebSocket] Stream error: {e}")
+            logger.warning("Stream error: %s", e)
             if connection_id in active_connections:
-                active_connections[connection_id].send(json.dumps({
+                _send_json(active_connections[connection_id], {
                     'type': 'error',
                     'error': str(e)
-                }))
-    
-    # Start streaming in background thread
-    thread = threading.Thread(target=stream_audio)
-    thread.daemon = True
-    thread.start()
+                })
+        finally:
+            sender.cancel()
+            await job_manager.close_all()
+    
+    # Schedule on the shared loop; the future lets cancel stop the job
+    future = asyncio.run_coroutine_threadsafe(stream_audio(), get_tts_loop())
+    futures = connection_flags[connection_id].setdefault('futures', set())
+    futures.add(future)
+    future.add_done_callback(futures.discard)
+
+
+def _cancel_tts_jobs(flags: dict) -> None:
+    """Cancel every TTS job still running for a connection."""
+    # Cancelling a future cancels its job's task on the TTS loop
+    for future in list(flags.get('futures', ())):
+        future.cancel()
 
 def handle_websocket_cancel(ws, data, connection_id):
     """Handle cancellation of TTS streaming."""
     job_id = data.get('id')
     
-    # Set cancellation flag for this connection
-    connection_flags[connection_id]['cancelled'] = True
+    _cancel_tts_jobs(connection_flags[connection_id])
     
     # Send confirmation
-    ws.send(json.dumps({
+    _send_json(ws, {
         'type': 'cancelled',
         'id': job_id
-    }))
+    })
 
 if __name__ == "__main__":
     # Initialize the default agent
-    load_agent(current_agent)
-    print(f"AugTwins Flask server starting with agent: {current_agent.name}")
+    load_agent(STATE.agent)
+    print(f"AugTwins Flask server starting with agent: {STATE.agent.name}")
     print("Debug interface available at: http://localhost:5000")
     
-    # Run Flask app with plain WebSocket support
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # Development server only; for deployment use: gunicorn -c gunicorn.conf.py wsgi:app
+    # threaded so concurrent chats overlap their LLM/TTS network waits
+    app.run(host='0.0.0.0', port=5001, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
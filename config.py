@@ -4,10 +4,17 @@ Loads from environment variables with .env file support.
 """
 import os
 import sys
-from dotenv import load_dotenv
 
-# Load environment variables from .env file if it exists
-load_dotenv()
+# Load environment variables from .env file if it exists. Skipped when a
+# parent process already did (the flag is inherited) or dotenv isn't installed.
+if not os.getenv("_DOTENV_LOADED"):
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv()
+        os.environ["_DOTENV_LOADED"] = "1"
 
 # Required API keys
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
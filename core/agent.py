@@ -1,33 +1,33 @@
 """Digital-Twin agent: episodic memory, retrieval, LLM chat, optional TTS."""
 from __future__ import annotations
+import functools
+import hashlib
 import json
 import time
 import os
+import re
+import sys
+import threading
 from dataclasses import dataclass, field
-from typing import List, Dict, Set, Sequence
+from typing import Any, Dict, Generator, Iterator, List, Optional, Set, Sequence, Tuple
+
+import numpy as np
 
 try:
     import requests
 except ModuleNotFoundError:  # allow tests without requests
     requests = None
 
+# Optional hnswlib dependency; approximate search for large memory stores
 try:
-    from sentence_transformers import SentenceTransformer, util
-except ModuleNotFoundError:  # graceful fallback if dependency missing
-    import types
-
-    class SentenceTransformer:
-        def __init__(self, *args, **kwargs) -> None:
-            pass
-
-        def encode(self, texts):
-            if isinstance(texts, list):
-                return [[0.0, 0.0, 0.0] for _ in texts]
-            return [0.0, 0.0, 0.0]
-
-    util = types.SimpleNamespace(cos_sim=lambda a, b: 0.0)
+    import hnswlib
+    HNSW_AVAILABLE = True
+except ImportError:
+    HNSW_AVAILABLE = False
 
 from . import memory_utils as mu
+from .background import BackgroundQueue
+from .embedding_cache import EmbeddingCache, encode_cached
 from . import utterance_utils
 
 # API keys - load from centralized config
@@ -37,15 +37,142 @@ if MEM0_API_KEY and requests is None:
     print("[Mem0 disabled] install 'requests' to enable remote features")
 
 
-# Shared embedder
-_EMBEDDER = SentenceTransformer("all-MiniLM-L6-v2")
+# Shared embedder: the int8 ONNX export of MiniLM on onnxruntime when
+# available (sentence-transformers>=3.2 with the [onnx] extra), else PyTorch.
+# Loaded on first use, so importing this module doesn't load a model.
+EMBED_MODEL = "all-MiniLM-L6-v2"
+_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+_embedder_state = None
+_embedder_lock = threading.Lock()
 
 
-@dataclass
+class _StubEmbedder:
+    """Zero vectors, used when sentence-transformers isn't installed."""
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, list):
+            return np.zeros((len(texts), 3), dtype=np.float32)
+        return np.zeros(3, dtype=np.float32)
+
+
+def _load_embedder():
+    """Return ``(embedder, id)``; *id* names the exact weights, for cache keys."""
+    # Imported here, not at module load: sentence-transformers pulls in torch
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ModuleNotFoundError:  # graceful fallback if dependency missing
+        return _StubEmbedder(), "stub"
+    if os.getenv("EMBED_BACKEND", "onnx").lower() == "onnx":
+        try:
+            model = SentenceTransformer(EMBED_MODEL, backend="onnx", model_kwargs={"file_name": _ONNX_FILE})
+            return model, f"{EMBED_MODEL}:{_ONNX_FILE}"
+        except Exception as e:  # old sentence-transformers, no onnxruntime, missing file
+            print(f"[Embedder] ONNX backend unavailable ({e}); using PyTorch")
+    return SentenceTransformer(EMBED_MODEL), EMBED_MODEL
+
+
+def _embedder_and_id():
+    global _embedder_state
+    if _embedder_state is None:
+        with _embedder_lock:
+            if _embedder_state is None:
+                _embedder_state = _load_embedder()
+    return _embedder_state
+
+
+def _embedder():
+    """The shared SentenceTransformer, loaded on the first call."""
+    return _embedder_and_id()[0]
+
+
+def __getattr__(name: str):
+    # `from core.agent import _EMBEDDER` keeps working; loads on first access
+    if name == "_EMBEDDER":
+        return _embedder()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def embedder_id() -> str:
+    """Name of the loaded embedding weights (loads the model if needed)."""
+    return _embedder_and_id()[1]
+
+
+@functools.lru_cache(maxsize=None)
+def embedding_cache() -> EmbeddingCache:
+    """On-disk vectors for memory texts, keyed by the exact weights in use."""
+    # int8 ONNX and FP32 vectors must not mix
+    return EmbeddingCache(embedder_id())
+
+
+def _encode_texts(texts: Sequence[str]) -> np.ndarray:
+    """Embed *texts* as unit-length float32 rows in one batched call."""
+    return np.asarray(
+        _embedder().encode(list(texts), batch_size=64, convert_to_numpy=True,
+                           normalize_embeddings=True, show_progress_bar=False),
+        dtype=np.float32,
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _encode_query(text: str) -> np.ndarray:
+    """Embed one query; repeats (retries, the reply cache, retrieval) are lookups."""
+    vec = _normalise(_encode_texts([text]))[0]
+    vec.flags.writeable = False  # shared by every caller of the cache
+    return vec
+
+
+def _normalise(vecs: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so a dot product is cosine similarity."""
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+# Unit vectors are held as int8 codes: component * 127, a quarter of float32
+EMB_SCALE = 127.0
+# Rows expanded to float32 per step when scoring; keeps the temporary in cache
+_SCAN_BLOCK = 1024
+# Below this many memories an exact scan beats building/querying an HNSW graph
+ANN_MIN_ROWS = 256
+
+
+# Guards the lazy creation of each agent's background memory writer
+_sync_lock = threading.Lock()
+
+
+def _write_latest(snaps: list) -> None:
+    # Coalesce: a newer snapshot holds everything an older queued one does
+    try:
+        mu.write_memories(snaps[-1])
+    except Exception as e:
+        print(f"[Agent] Memory sync failed: {e}")
+
+
+# `graph_context` switches to bottom-up steps once the frontier holds more
+# than 1/_BOTTOM_UP_RATIO of the graph's nodes
+_BOTTOM_UP_RATIO = 20
+
+
+def _text_hash(text: str) -> bytes:
+    """128-bit digest identifying a memory text (for dedup)."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _to_codes(vecs: np.ndarray) -> np.ndarray:
+    """Quantise unit-length rows to int8 with the fixed scale `EMB_SCALE`."""
+    return np.clip(np.rint(vecs * EMB_SCALE), -127, 127).astype(np.int8)
+
+
+# Memories are many and small: __slots__ drop the per-instance __dict__
+# (dataclass slots need Python 3.10+; older versions just skip them)
+_SLOTS: Dict[str, bool] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class Memory:
     text: str
     timestamp: float
-    embedding: List[float] = field(default_factory=list)
+    # Only set while a loaded vector waits to move into `Agent`'s buffer
+    embedding: Sequence[float] = ()
     is_summary: bool = False
 
 
@@ -60,11 +187,51 @@ class Agent:
     max_context_turns: int = 10
     _sync_every: int = 5
     _unsynced_count: int = 0
+    # Embeddings live here rather than on each Memory: a growable int8 buffer
+    # whose first `_emb_rows` rows are the quantised unit vector of `_emb_src[i]`
+    _emb: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+    _emb_rows: int = field(default=0, repr=False, compare=False)
+    _emb_src: Optional[List[Memory]] = field(default=None, repr=False, compare=False)
+    # hnswlib mirror of the buffer (labels are row numbers), for `_ann_src`
+    _ann: Any = field(default=None, repr=False, compare=False)
+    _ann_src: Optional[List[Memory]] = field(default=None, repr=False, compare=False)
+    # Held while the graph is grown here or saved by the background writer
+    _ann_lock: Any = field(default_factory=threading.Lock, repr=False, compare=False)
+    # Over the first `_index_rows` of `_index_src`, kept incrementally: how
+    # many are raw (for `_auto_rollup`) and their text digests (for dedup)
+    _raw_count: int = field(default=0, repr=False, compare=False)
+    _text_hashes: Set[bytes] = field(default_factory=set, repr=False, compare=False)
+    _index_rows: int = field(default=0, repr=False, compare=False)
+    _index_src: Optional[List[Memory]] = field(default=None, repr=False, compare=False)
+    # Reverse adjacency of `_graph_rev_src` (node -> nodes pointing at it),
+    # kept by `_update_graph` for bottom-up steps in `graph_context`
+    _graph_rev: Dict[str, Set[str]] = field(default_factory=dict, repr=False, compare=False)
+    _graph_rev_src: Optional[Dict[str, Set[str]]] = field(default=None, repr=False, compare=False)
+    # Background writer for `sync_memories`, one per agent
+    _sync_queue: Optional[BackgroundQueue] = field(default=None, repr=False, compare=False)
+    # Semantic reply cache, oldest first: (query vectors, [(model, mode, reply)]).
+    # Swapped as one tuple so concurrent readers never see mismatched halves.
+    _qcache: Tuple[Optional[np.ndarray], List[Tuple[str, str, str]]] = field(
+        default_factory=lambda: (None, []), repr=False, compare=False
+    )
 
     def sync_memories(self) -> None:
-        """Persist current memories to disk or Mem0 and reset counter."""
-        mu.save_memories(self)
+        """Queue current memories for the background writer and reset counter."""
+        snap = mu.snapshot_memories(self)
         self._unsynced_count = 0
+        if snap is not None:  # Mem0 memories are saved as they're added
+            self._sync_writer().put(snap)
+
+    def _sync_writer(self) -> BackgroundQueue:
+        with _sync_lock:
+            if self._sync_queue is None:
+                self._sync_queue = BackgroundQueue(f"{self.name}-sync", _write_latest, max_items=None)
+            return self._sync_queue
+
+    def close(self) -> None:
+        """Block until this agent's queued memory snapshots are written."""
+        if self._sync_queue is not None:
+            self._sync_queue.join()
 
     def _maybe_sync(self) -> None:
         self._unsynced_count += 1
@@ -74,7 +241,7 @@ class Agent:
     def trim_memory(self, limit: int) -> None:
         """Keep only the most recent *limit* memories and sync."""
         if len(self.memory) > limit:
-            self.memory = self.memory[-limit:]
+            self._select_memories(range(len(self.memory) - limit, len(self.memory)))
             self.sync_memories()
     
     def add_to_context(self, role: str, message: str) -> None:
@@ -94,111 +261,301 @@ class Agent:
         return "\n".join(context_lines)
     
     def clear_context(self) -> None:
-        """Clear the conversation context."""
+        """Clear the conversation context (and the replies cached within it)."""
         self.conversation_context = []
+        # Cached replies were written for that context ("what did I just say?")
+        self._qcache = (None, [])
 
     # ── Embedding helpers
-    def _ensure_embeddings(self, mems: Sequence[Memory]) -> None:
-        missing = [m for m in mems if not m.embedding]
-        if missing:
-            vecs = _EMBEDDER.encode([m.text for m in missing])
-            for m, v in zip(missing, vecs):
-                if hasattr(v, "tolist"):
-                    m.embedding = v.tolist()
-                else:
-                    m.embedding = list(v)
+    @staticmethod
+    def _encode(texts: Sequence[str]) -> np.ndarray:
+        """Embed memory *texts* in one batch; texts seen before (reloads,
+        repeated seeds) come from the on-disk cache instead of the model."""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return encode_cached(_embedder(), embedding_cache(), texts, batch_size=64,
+                             convert_to_numpy=True, normalize_embeddings=True,
+                             show_progress_bar=False)
+
+    def _store_codes(self, codes: np.ndarray) -> None:
+        """Append int8 rows to the embedding buffer, doubling its capacity when full."""
+        rows, n = self._emb_rows, self._emb_rows + len(codes)
+        if self._emb is None or rows == 0 or self._emb.shape[1] != codes.shape[1]:
+            self._emb = np.empty((max(n, 64), codes.shape[1]), dtype=np.int8)
+        elif n > len(self._emb):
+            grown = np.empty((max(n, 2 * len(self._emb)), self._emb.shape[1]), dtype=np.int8)
+            grown[:rows] = self._emb[:rows]
+            self._emb = grown
+        self._emb[rows:n] = codes
+        self._emb_rows = n
+
+    def embedding_codes(self) -> np.ndarray:
+        """Return an ``(N, D)`` int8 view of the embeddings for `self.memory`.
+
+        Memories added since the last call are embedded in one batch.  Their
+        vectors move into the shared buffer and `Memory.embedding` is cleared,
+        so each embedding is held once, as one byte per dimension.  If
+        `self.memory` is replaced wholesale, the buffer is rebuilt (memories
+        without a stored vector are re-encoded).
+        """
+        mems = self.memory
+        if self._emb_src is not mems or self._emb_rows > len(mems):
+            self._emb_src, self._emb_rows = mems, 0
+        if self._emb_rows < len(mems):
+            tail = mems[self._emb_rows:]
+            missing = [m for m in tail if not len(m.embedding)]
+            if len(missing) == len(tail):
+                # The usual case: the encoder's (M, D) array goes in as-is
+                vecs = self._encode([m.text for m in tail])
+            else:
+                fresh = iter(self._encode([m.text for m in missing]) if missing else ())
+                vecs = np.asarray([m.embedding if len(m.embedding) else next(fresh) for m in tail],
+                                  dtype=np.float32)
+            self._store_codes(_to_codes(_normalise(vecs)))
+            for m in tail:
+                m.embedding = ()
+        if self._emb is None:
+            return np.empty((0, 0), dtype=np.int8)
+        return self._emb[:self._emb_rows]
+
+    def embedding_matrix(self) -> np.ndarray:
+        """Return the embeddings for `self.memory` decoded to float32."""
+        return self.embedding_codes().astype(np.float32) / EMB_SCALE
+
+    def _scores(self, q_vec: np.ndarray) -> np.ndarray:
+        """Inner product of *q_vec* with every stored row, up to the constant scale."""
+        codes = self.embedding_codes()
+        scores = np.empty(len(codes), dtype=np.float32)
+        for i in range(0, len(codes), _SCAN_BLOCK):
+            scores[i:i + _SCAN_BLOCK] = codes[i:i + _SCAN_BLOCK].astype(np.float32) @ q_vec
+        return scores
+
+    def _use_ann(self, rows: int) -> bool:
+        return HNSW_AVAILABLE and rows >= ANN_MIN_ROWS
+
+    def _ann_search(self, q_vec: np.ndarray, k: int) -> np.ndarray:
+        """Row numbers of the approximate top-*k* rows, best first.
+
+        Like the buffer, the index only grows by appending; it is rebuilt
+        when `self.memory` is replaced (trim, roll-up, reload).
+        """
+        codes = self.embedding_codes()
+        ann = self._ann
+        if ann is None or self._ann_src is not self.memory or ann.get_current_count() > len(codes):
+            # A graph saved by the last sync is reused if it covers these exact rows
+            ann = mu.load_ann_index(self.name, codes)
+            if ann is None:
+                ann = hnswlib.Index(space="ip", dim=codes.shape[1])
+                ann.init_index(max_elements=max(2 * len(codes), 1024), ef_construction=100, M=16)
+            self._ann, self._ann_src = ann, self.memory
+        done = ann.get_current_count()
+        if done < len(codes):
+            with self._ann_lock:
+                if len(codes) > ann.get_max_elements():
+                    ann.resize_index(max(len(codes), 2 * ann.get_max_elements()))
+                ann.add_items(codes[done:].astype(np.float32) / EMB_SCALE, np.arange(done, len(codes)))
+        ann.set_ef(max(64, k))
+        labels, _ = ann.knn_query(q_vec, k=k)
+        return labels[0]
+
+    def ann_index(self) -> Any:
+        """The HNSW index if it covers every stored row, else None (for saving)."""
+        ann = self._ann
+        if ann is None or self._ann_src is not self.memory:
+            return None
+        return ann if ann.get_current_count() == self._emb_rows else None
+
+    def _add_embedded_memories(self, texts: Sequence[str], vecs: np.ndarray) -> None:
+        """Append memories whose embeddings were computed by the caller."""
+        self.embedding_codes()  # bring the buffer level with self.memory first
+        now = time.time()
+        self.memory.extend(Memory(text=t, timestamp=now) for t in texts)
+        self._store_codes(_to_codes(_normalise(np.asarray(vecs, dtype=np.float32))))
+        for t in texts:
+            self._update_graph(t)
+
+    def _select_memories(self, keep: Sequence[int]) -> None:
+        """Keep only the memories at indices *keep*, along with their rows."""
+        keep = list(keep)
+        codes = self.embedding_codes()
+        self.memory = [self.memory[i] for i in keep]
+        self._emb_src, self._emb_rows = self.memory, 0
+        if keep:
+            self._store_codes(codes[keep])
 
     # ── Graph helpers
     def _update_graph(self, text: str) -> None:
         """Parse simple 'A -> B' or 'A is B' patterns into graph edges."""
-        if "->" in text:
-            a, b = [p.strip().lower() for p in text.split("->", 1)]
-            if a and b:
-                self.graph.setdefault(a, set()).add(b)
-        elif " is " in text:
-            a, b = [p.strip().lower() for p in text.split(" is ", 1)]
-            if a and b:
-                self.graph.setdefault(a, set()).add(b)
+        # str.partition scans once and allocates no list; an arrow anywhere
+        # takes precedence over ' is '
+        a, sep, b = text.partition("->")
+        if not sep:
+            a, sep, b = text.partition(" is ")
+            if not sep:
+                return
+        a, b = a.strip().lower(), b.strip().lower()
+        if a and b:
+            self.graph.setdefault(a, set()).add(b)
+            if self._graph_rev_src is self.graph:
+                self._graph_rev.setdefault(b, set()).add(a)
 
     def rebuild_graph(self) -> None:
         """Recreate graph edges from stored memories."""
         self.graph.clear()
+        self._graph_rev_src = None
         for m in self.memory:
             self._update_graph(m.text)
 
+    def _reverse_graph(self) -> Dict[str, Set[str]]:
+        """Reverse adjacency of `self.graph`, rebuilt if the graph was replaced."""
+        if self._graph_rev_src is not self.graph:
+            rev: Dict[str, Set[str]] = {}
+            for a, nbs in self.graph.items():
+                for b in nbs:
+                    rev.setdefault(b, set()).add(a)
+            self._graph_rev, self._graph_rev_src = rev, self.graph
+        return self._graph_rev
+
     def graph_context(self, query: str, depth: int = 1) -> List[str]:
         """Return nodes related to tokens in *query* within *depth* hops."""
+        graph = self.graph
         found: Set[str] = set()
-        tokens = {t.lower() for t in query.split()}
-        seeds = [t for t in tokens if t in self.graph]
-        for seed in seeds:
-            to_visit = {seed}
-            for _ in range(depth):
-                next_visit: Set[str] = set()
-                for node in to_visit:
-                    for nb in self.graph.get(node, set()):
-                        if nb not in found:
-                            found.add(nb)
-                            next_visit.add(nb)
-                to_visit = next_visit
+        if not graph or depth < 1:
+            return []
+        # Level-synchronous BFS: one C-level set.union per hop.  Once the
+        # frontier is a sizeable share of the graph, a bottom-up step (which
+        # unreached nodes have a parent in the frontier?) touches fewer edges.
+        # Only tokens that are nodes can lead anywhere, and counting the rest
+        # would trip the bottom-up test on every query against a small graph
+        frontier = {t.lower() for t in query.split()} & graph.keys()
+        for _ in range(depth):
+            if len(frontier) * _BOTTOM_UP_RATIO > len(graph):
+                rev = self._reverse_graph()
+                frontier = {v for v in rev.keys() - found if not rev[v].isdisjoint(frontier)}
+            else:
+                frontier = set().union(*(graph.get(n, ()) for n in frontier)) - found
+            if not frontier:
+                break
+            found |= frontier
         return list(found)
 
     # Memory CRUD & roll-up
     _MAX_RAW = 200
     _CHUNK   = 50
+    _EMBED_FLUSH = 16  # pending memories that trigger a batched encode
 
     def add_memory(self, text: str, *, is_summary: bool = False) -> None:
-        emb = _EMBEDDER.encode(text)
-        if hasattr(emb, "tolist"):
-            emb = emb.tolist()
-        else:
-            emb = list(emb)
-        mem = Memory(
-            text=text,
-            timestamp=time.time(),
-            embedding=emb,
-            is_summary=is_summary,
-        )
+        # A text already in memory is skipped before any encoding or parsing
+        self._index_memories()
+        digest = _text_hash(text)
+        if digest in self._text_hashes:
+            return
+        # Encoding is deferred and batched: at the next retrieval or sync, or
+        # once `_EMBED_FLUSH` memories are pending, whichever comes first
+        mem = Memory(text=text, timestamp=time.time(), is_summary=is_summary)
         self.memory.append(mem)
+        self._text_hashes.add(digest)
+        self._raw_count += not is_summary
+        self._index_rows += 1
+        if self._emb_src is self.memory and len(self.memory) - self._emb_rows >= self._EMBED_FLUSH:
+            self.embedding_codes()
         self._update_graph(text)
         self._maybe_sync()
         self._auto_rollup()
 
+    def _index_memories(self) -> None:
+        """Bring the raw count and text digests level with `self.memory`."""
+        mems = self.memory
+        if self._index_src is not mems or self._index_rows > len(mems):
+            self._index_src, self._index_rows = mems, 0
+            self._raw_count = 0
+            self._text_hashes = set()
+        if self._index_rows < len(mems):
+            tail = mems[self._index_rows:]
+            self._raw_count += sum(not m.is_summary for m in tail)
+            self._text_hashes.update(_text_hash(m.text) for m in tail)
+            self._index_rows = len(mems)
+
     def _auto_rollup(self) -> None:
-        raw = [m for m in self.memory if not m.is_summary]
-        if len(raw) > self._MAX_RAW:
-            oldest = raw[:self._CHUNK]
+        if len(self.memory) <= self._MAX_RAW:
+            return
+        self._index_memories()
+        if self._raw_count <= self._MAX_RAW:
+            return
+        raw = [i for i, m in enumerate(self.memory) if not m.is_summary]
+        if len(raw) > self._MAX_RAW:  # one scan per roll-up, not per add
+            oldest = set(raw[:self._CHUNK])
             summary = mu.llm_summarise_block(
-                "\n".join(m.text for m in oldest), agent_name=self.name
+                "\n".join(self.memory[i].text for i in sorted(oldest)), agent_name=self.name
             )
-            self.memory = [m for m in self.memory if m not in oldest]
+            self._select_memories(i for i in range(len(self.memory)) if i not in oldest)
             self.add_memory(f"(summary) {summary}", is_summary=True)
 
     # Retrieval
     def retrieve_memories(self, query: str, top_k: int = 5) -> List[str]:
         results: List[str] = []
         local_results: List[str] = []
-        if self.memory:
-            self._ensure_embeddings(self.memory)
-            q_vec = _EMBEDDER.encode(query)
-            scored = [(float(util.cos_sim(q_vec, m.embedding)), m) for m in self.memory]
-            scored.sort(key=lambda t: t[0], reverse=True)
-            local_results = [m.text for _, m in scored[:top_k]]
-
-        # Merge remote and local results, prioritising remote
-        merged: List[str] = []
-        for txt in results + local_results:
-            if txt not in merged:
-                merged.append(txt)
-            if len(merged) >= top_k:
+        if self.memory and top_k > 0:
+            # The query stays float32; only the stored side is quantised
+            q_vec = self._query_vec(query)
+            rows = len(self.embedding_codes())
+            k = min(top_k, rows)
+            if self._use_ann(rows):
+                top_idx = self._ann_search(q_vec, k)
+            else:
+                scores = self._scores(q_vec)
+                top_idx = np.argpartition(-scores, k - 1)[:k]
+                top_idx = top_idx[np.argsort(-scores[top_idx])]
+            local_results = [self.memory[i].text for i in top_idx]
+
+        # Merge remote and local results, prioritising remote; dict.fromkeys
+        # dedups in insertion order
+        return list(dict.fromkeys(results + local_results))[:max(top_k, 0)]
+
+    # Semantic reply cache: a message within `_QCACHE_THRESHOLD` cosine of an
+    # earlier one (same model and mode) reuses that reply instead of the LLM
+    _QCACHE_SIZE = 128
+    _QCACHE_THRESHOLD = 0.92
+    _QCACHE_MIN_WORDS = 4  # short turns ("yes", "why?") depend on context
+
+    def _query_vec(self, text: str) -> np.ndarray:
+        """Unit-length float32 embedding of a single query (LRU-cached)."""
+        return _encode_query(text)
+
+    def _reply_cache_vec(self, user_msg: str) -> Optional[np.ndarray]:
+        """Query vector for the reply cache, or None if *user_msg* is too short."""
+        if len(user_msg.split()) < self._QCACHE_MIN_WORDS:
+            return None
+        return self._query_vec(user_msg)
+
+    def _cached_reply(self, q_vec: np.ndarray, model: str, mode: str) -> Optional[str]:
+        vecs, entries = self._qcache
+        if vecs is None:
+            return None
+        scores = vecs @ q_vec
+        for i in np.argsort(-scores):
+            if scores[i] < self._QCACHE_THRESHOLD:
                 break
-        return merged
+            if entries[i][:2] == (model, mode):
+                keep = np.arange(len(entries)) != i  # re-added below as most recent
+                self._qcache = (vecs[keep], [e for j, e in enumerate(entries) if j != i])
+                # Under its original vector, so the key can't drift with paraphrases
+                self._cache_reply(vecs[i], model, mode, entries[i][2])
+                return entries[i][2]
+        return None
+
+    def _cache_reply(self, q_vec: np.ndarray, model: str, mode: str, reply: str) -> None:
+        vecs, entries = self._qcache
+        vecs = q_vec[None, :] if vecs is None or not len(vecs) else np.vstack([vecs, q_vec])
+        entries = entries + [(model, mode, reply)]
+        if len(entries) > self._QCACHE_SIZE:  # evict least recently used
+            vecs, entries = vecs[1:], entries[1:]
+        self._qcache = (vecs, entries)
 
     # LLM response
-    def generate_response(self, user_msg: str, *, model: str = "gpt-4o-mini", mode: str = "conversation") -> str:
-        # Add user message to context
-        self.add_to_context("user", user_msg)
-        
+    def _utterance_kwargs(self, user_msg: str, *, model: str, mode: str) -> Dict[str, Any]:
+        """Collect context, memories and graph hints for `utterance_utils`."""
         # Get conversation context and combine with retrieved memories
         context_string = self.get_context_string()
         retrieved_memories = "\n".join(self.retrieve_memories(user_msg))
@@ -212,7 +569,7 @@ class Agent:
             relevant = retrieved_memories
         
         graph_info = ", ".join(self.graph_context(user_msg))
-        response = utterance_utils.generate_utterance(
+        return dict(
             agent_name=self.name,
             personality=self.personality,
             user_msg=user_msg,
@@ -222,12 +579,63 @@ class Agent:
             temperature=0.5,
             mode=mode,
         )
-        
+
+    def _remember_exchange(self, user_msg: str, response: str) -> None:
         # Add response to context
         self.add_to_context("agent", response)
         
         # Store in long-term memory
         self.add_memory(f"User: {user_msg}\n{self.name}: {response}")
+
+    def generate_response(self, user_msg: str, *, model: str = "gpt-4o-mini", mode: str = "conversation") -> str:
+        # Add user message to context
+        self.add_to_context("user", user_msg)
+        
+        q_vec = self._reply_cache_vec(user_msg)
+        response = self._cached_reply(q_vec, model, mode) if q_vec is not None else None
+        if response is None:
+            response = utterance_utils.generate_utterance(
+                **self._utterance_kwargs(user_msg, model=model, mode=mode)
+            )
+            if q_vec is not None and response:
+                self._cache_reply(q_vec, model, mode, response)
+        self._remember_exchange(user_msg, response)
+        return response
+
+    def generate_response_stream(
+        self, user_msg: str, *, model: str = "gpt-4o-mini", mode: str = "conversation"
+    ) -> Generator[str, None, str]:
+        """Yield the reply sentence by sentence while the LLM is still decoding.
+
+        Context and memory bookkeeping happen once the stream is exhausted, with
+        the same full reply text `generate_response` would have returned; that
+        text is also the generator's return value (``reply = yield from ...``),
+        with the whitespace and line breaks the yielded sentences drop.
+        """
+        self.add_to_context("user", user_msg)
+        
+        q_vec = self._reply_cache_vec(user_msg)
+        cached = self._cached_reply(q_vec, model, mode) if q_vec is not None else None
+        if cached is not None:
+            yield from utterance_utils.iter_sentences(re.findall(r"\S+\s*", cached))
+            self._remember_exchange(user_msg, cached)
+            return cached
+        
+        pieces: List[str] = []
+
+        def _collect(deltas: Iterator[str]) -> Iterator[str]:
+            for delta in deltas:
+                pieces.append(delta)
+                yield delta
+
+        deltas = utterance_utils.generate_utterance_stream(
+            **self._utterance_kwargs(user_msg, model=model, mode=mode)
+        )
+        yield from utterance_utils.iter_sentences(_collect(deltas))
+        response = "".join(pieces).strip()
+        if q_vec is not None and response:
+            self._cache_reply(q_vec, model, mode, response)
+        self._remember_exchange(user_msg, response)
         return response
 
        # Speech synthesis (delegates to tts_utils)
@@ -0,0 +1,112 @@
+"""Background worker threads that are started lazily, once per process.
+
+Threads don't survive a fork, so nothing here starts a thread at import
+time. A pre-forking server (gunicorn with preload_app) would lose it.
+Each worker starts the first time it is used in the current process.
+"""
+from __future__ import annotations
+import atexit
+import functools
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Also guards the factories below, which may start other workers
+_lock = threading.RLock()
+# (pid, queue) for every BackgroundQueue started, joined at exit
+_started: List[Tuple[int, "queue.Queue"]] = []
+
+
+def per_process(factory: Callable[[], T]) -> Callable[[], T]:
+    """Call *factory* on first use in each process and return its result after that."""
+    owner: List[Any] = [0, None]  # [pid, result]
+
+    @functools.wraps(factory)
+    def get() -> T:
+        with _lock:
+            if owner[0] != os.getpid():
+                owner[1] = factory()
+                owner[0] = os.getpid()
+            return owner[1]
+    return get
+
+
+class BackgroundQueue:
+    """A queue served by one daemon thread that runs ``handle(items)``.
+
+    The thread starts on the first `put` in each process. It blocks for one
+    item, then waits up to *linger* seconds to collect at most *max_items*
+    (``None`` takes everything already queued). Queued items are written out
+    at interpreter exit; see `flush_all`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handle: Callable[[list], None],
+        *,
+        maxsize: int = 0,
+        max_items: Optional[int] = 1,
+        linger: float = 0.0,
+    ) -> None:
+        self.name = name
+        self._handle = handle
+        self._maxsize = maxsize
+        self._max_items = max_items
+        self._linger = linger
+        self._queue = per_process(self._start)
+        self._pid = 0
+
+    def _start(self) -> "queue.Queue":
+        q: "queue.Queue" = queue.Queue(self._maxsize)
+        threading.Thread(target=self._run, args=(q,), name=self.name, daemon=True).start()
+        self._pid = os.getpid()
+        _started.append((self._pid, q))
+        return q
+
+    def _run(self, q: "queue.Queue") -> None:
+        while True:
+            items = [q.get()]
+            deadline = time.monotonic() + self._linger
+            while self._max_items is None or len(items) < self._max_items:
+                try:
+                    # A zero timeout still returns an item that is already queued
+                    items.append(q.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self._handle(items)
+            except Exception as e:
+                print(f"[{self.name}] Background task failed: {e}")
+            finally:
+                for _ in items:
+                    q.task_done()
+
+    def put(self, item: Any) -> bool:
+        """Queue *item* without blocking; returns False if the queue is full."""
+        try:
+            self._queue().put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def join(self) -> None:
+        """Block until every item queued by this process has been handled."""
+        if self._pid == os.getpid():
+            self._queue().join()
+
+
+def flush_all() -> None:
+    """Wait for every background queue started in this process to drain."""
+    pid = os.getpid()
+    for owner, q in list(_started):
+        if owner == pid:
+            q.join()
+
+
+# Registered at import, before the app's own exit hooks, so it runs after them
+atexit.register(flush_all)
@@ -0,0 +1,83 @@
+"""Persistent cache of sentence embeddings, keyed by a hash of model + text.
+
+Seed memories are the same on every start, so re-embedding them is wasted
+model inference.  Vectors are stored as float16 blobs in SQLite (half the
+size of float32; plenty for cosine search).
+"""
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+_DEFAULT_PATH = Path("memories") / "embedding_cache.sqlite3"
+
+
+class EmbeddingCache:
+    """Thread-safe get/put of embedding vectors by text for one model."""
+
+    def __init__(self, model_name: str, path: Path = _DEFAULT_PATH) -> None:
+        self.model_name = model_name
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Reopen after a fork: SQLite connections must not cross processes
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (sha256 BLOB PRIMARY KEY, vec BLOB)"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return ``{text: float32 vector}`` for the texts already cached."""
+        keys = {self._key(t): t for t in texts}
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            db = self._db()
+            key_list = list(keys)
+            for i in range(0, len(key_list), 500):  # stay under SQLite's variable limit
+                batch = key_list[i:i + 500]
+                rows = db.execute(
+                    f"SELECT sha256, vec FROM embeddings WHERE sha256 IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[keys[key]] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors) -> None:
+        """Store one vector per text (overwriting any previous entry)."""
+        rows = [
+            (self._key(t), np.asarray(v, dtype=np.float16).tobytes())
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            db = self._db()
+            db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", rows)
+            db.commit()
+
+
+def encode_cached(embedder, cache: EmbeddingCache, texts: List[str], **encode_kwargs) -> np.ndarray:
+    """Embed *texts* with *embedder*, encoding only those not in *cache*."""
+    found = cache.get_many(texts)
+    missing = list(dict.fromkeys(t for t in texts if t not in found))
+    if missing:
+        vecs = np.asarray(embedder.encode(missing, **encode_kwargs), dtype=np.float32)
+        cache.put_many(missing, vecs)
+        if len(missing) == len(texts):  # all new and distinct: already in order
+            return vecs
+        found.update(zip(missing, vecs))
+    return np.stack([found[t] for t in texts]) if texts else np.empty((0, 0), np.float32)
@@ -4,36 +4,44 @@ this module focuses solely on LLM calls.
 """
 from __future__ import annotations
 import os
-from typing import List, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 try:
     from openai import OpenAI
 except ModuleNotFoundError:  # allow tests without openai installed
     OpenAI = None
 
+try:
+    import httpx  # ships with openai
+except ModuleNotFoundError:
+    httpx = None
+
 # API key - load from centralized config
 from config import OPENAI_API_KEY
 
 if OpenAI:
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    # One bounded keep-alive pool shared by every request thread, so
+    # concurrent chats reuse warm TLS connections to the API
+    _http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    ) if httpx else None
+    client = OpenAI(api_key=OPENAI_API_KEY, http_client=_http_client)
 else:
     client = None
 
 
-def chat(
+def _completion_kwargs(
     messages: List[Dict[str, str]],
     *,
-    model: str = "gpt-4o-mini",
-    temperature: float = 0.2,
-    max_tokens: Optional[int] = None,
-    max_completion_tokens: Optional[int] = None,
-) -> str:
-    """Basic wrapper that returns *only* the assistant reply string."""
-    if not client:
-        raise RuntimeError("OpenAI client unavailable")
-    
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int],
+    max_completion_tokens: Optional[int],
+) -> Dict[str, Any]:
+    """Build ChatCompletion kwargs, picking the right token-limit field per model."""
     # Use max_completion_tokens for GPT-5 models, max_tokens for others
-    kwargs = {
+    kwargs: Dict[str, Any] = {
         "model": model,
         "messages": messages,
         "temperature": temperature,
@@ -47,12 +55,72 @@ def chat(
     else:
         if max_tokens is not None:
             kwargs["max_tokens"] = max_tokens
+    return kwargs
+
+
+def chat(
+    messages: List[Dict[str, str]],
+    *,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+    max_completion_tokens: Optional[int] = None,
+) -> str:
+    """Basic wrapper that returns *only* the assistant reply string."""
+    if not client:
+        raise RuntimeError("OpenAI client unavailable")
     
+    kwargs = _completion_kwargs(
+        messages,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        max_completion_tokens=max_completion_tokens,
+    )
     resp = client.chat.completions.create(**kwargs)
     content = resp.choices[0].message.content
     return content.strip() if content else ""
 
 
+def chat_stream(
+    messages: List[Dict[str, str]],
+    *,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+    max_completion_tokens: Optional[int] = None,
+) -> Iterator[str]:
+    """Like :func:`chat` but yields the reply incrementally as text deltas."""
+    if not client:
+        raise RuntimeError("OpenAI client unavailable")
+    
+    kwargs = _completion_kwargs(
+        messages,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        max_completion_tokens=max_completion_tokens,
+    )
+    for chunk in client.chat.completions.create(stream=True, **kwargs):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def warm_up(model: str = "gpt-4o-mini") -> bool:
+    """Open a pooled connection to the API so the first chat skips the handshake."""
+    if not client:
+        return False
+    try:
+        client.models.retrieve(model)  # metadata lookup, costs no tokens
+        return True
+    except Exception as e:
+        print(f"[LLM] Warm-up failed: {e}")
+        return False
+
+
 # convenience alias for the code-assistant REPL
 def gen_oai(history: List[Dict[str, str]], *, model: str = "gpt-4o-mini",
             temperature: float = 0.2) -> str:
@@ -5,21 +5,30 @@ This version avoids circular-import problems by:
   • Importing Memory lazily inside load_memories()
 """
 from __future__ import annotations
-import json
+import gzip
+import hashlib
+import io
+import os
 from pathlib import Path
 import time
-from typing import List, Dict, Any, Optional, TYPE_CHECKING
+from typing import List, Dict, Any, NamedTuple, Optional, TYPE_CHECKING
+
+import numpy as np
+import orjson
 
 if TYPE_CHECKING:
     from core.agent import Agent
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except ModuleNotFoundError:  # allow tests without requests
     requests = None
 
 # Mem0 API key - load from centralized config
 from config import MEM0_API_KEY, MEM0_ORG_ID, MEM0_PROJECT_ID
+from . import llm_utils
 
 # Optional forward references for static type checkers only
 if TYPE_CHECKING:          # <- evaluated by tools like mypy, ignored at runtime
@@ -40,14 +49,79 @@ def _use_remote() -> bool:
 
 
 def _path(name: str) -> Path:
-    """Return the local JSON file path for *name*'s memories."""
+    """Return the local gzipped JSON file path for *name*'s memories."""
+    return _DIR / f"{name.lower()}_memories.json.gz"
+
+
+def _legacy_path(name: str) -> Path:
+    """Return the uncompressed JSON that older versions wrote for *name*.
+
+    Only read, never written: a checked-in copy acts as the seed until the
+    first snapshot (``.json.gz``, not tracked by git) takes over.
+    """
     return _DIR / f"{name.lower()}_memories.json"
 
 
+def _emb_path(name: str) -> Path:
+    """Return the int8 ``.npy`` embedding matrix that sits next to *name*'s JSON."""
+    return _DIR / f"{name.lower()}_embeddings.npy"
+
+
+def _delta_path(name: str) -> Path:
+    """Return the append-only JSONL of memories added since the last snapshot."""
+    return _DIR / f"{name.lower()}_memories.jsonl"
+
+
+def _emb_delta_path(name: str) -> Path:
+    """Return the raw int8 rows that go with :func:`_delta_path`."""
+    return _DIR / f"{name.lower()}_embeddings.i8"
+
+
+def _ann_path(name: str) -> Path:
+    """Return the saved HNSW graph for *name*'s embeddings."""
+    return _DIR / f"{name.lower()}_ann.bin"
+
+
+def _fingerprint(codes: np.ndarray) -> bytes:
+    return hashlib.sha256(np.ascontiguousarray(codes).tobytes()).hexdigest().encode()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Replace *path* with *data*: raw ``os.write`` to a temp file, then rename.
+
+    Readers (and a crash mid-save) see either the old file or the new one.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+
+
 def _remote_url(name: str) -> str:
     """Return the Mem0 API URL for *name*'s memories."""
     return f"{_BASE_URL}/memories"
 
+_SESSION = None
+# (connect, read): fail fast on an unreachable host, allow slow summaries
+_TIMEOUT = (3, 30)
+
+
+def _session() -> "requests.Session":
+    """Shared keep-alive session, so Mem0 calls reuse TCP/TLS connections."""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = requests.Session()
+        # Retry gateway errors on idempotent calls (urllib3 leaves POST alone)
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        _SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return _SESSION
+
+
 def _remote_headers() -> Dict[str, str]:
     """Return the headers for Mem0 API requests."""
     return {
@@ -57,25 +131,157 @@ def _remote_headers() -> Dict[str, str]:
 
 
 # save / load
-def save_memories(agent: "Agent") -> None:  # quotes avoid runtime eval
+# Per agent: (memory list on disk, rows written, rows in the full snapshot)
+_SAVED: Dict[str, tuple] = {}
+
+
+def _record(m: "Memory") -> Dict[str, Any]:
+    return {"text": m.text, "timestamp": m.timestamp, "is_summary": m.is_summary}
+
+
+def _write_snapshot(name: str, memory: List["Memory"], codes: np.ndarray) -> None:
+    """Rewrite the compact JSON + int8 matrix and drop the delta sidecar."""
+    # Level 1 is cheap next to the write and still shrinks text several-fold
+    data = orjson.dumps([_record(m) for m in memory])
+    _write_atomic(_path(name), gzip.compress(data, compresslevel=1))
+    if len(codes):
+        # Already int8 with the fixed scale `EMB_SCALE`; a plain .npy so the
+        # loader can memory-map it instead of unpacking an archive
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(codes))
+        _write_atomic(_emb_path(name), buf.getbuffer())
+    _delta_path(name).unlink(missing_ok=True)
+    _emb_delta_path(name).unlink(missing_ok=True)
+
+
+def _append_delta(name: str, memory: List["Memory"], codes: np.ndarray, start: int) -> None:
+    """Append memories ``start:`` (and their int8 rows) to the sidecar files.
+
+    Each line carries its row index ``i`` so a loader can skip lines that a
+    snapshot written just before a crash already contains.
+    """
+    if start >= len(memory):
+        return
+    lines = b"".join(
+        orjson.dumps({**_record(m), "i": i}, option=orjson.OPT_APPEND_NEWLINE)
+        for i, m in enumerate(memory[start:], start)
+    )
+    with _delta_path(name).open("ab") as f:
+        f.write(lines)
+    if len(codes):
+        with _emb_delta_path(name).open("ab") as f:
+            f.write(np.ascontiguousarray(codes[start:]).tobytes())
+
+
+class MemorySnapshot(NamedTuple):
+    """What a save writes, captured on the agent's thread.
+
+    *source* is the agent's live list (its identity tells appends from a
+    trim/roll-up); *memory* is a copy of it; *codes* is a view of rows that
+    the agent never rewrites in place.
+    """
+    name: str
+    source: List["Memory"]
+    memory: List["Memory"]
+    codes: np.ndarray
+    ann: Any
+    ann_lock: Any
+
+
+def snapshot_memories(agent: "Agent") -> Optional[MemorySnapshot]:
+    """Capture *agent*'s memories for :func:`write_memories` (None with Mem0)."""
     if _use_remote():
         # For Mem0 Pro, we don't bulk save - memories are added individually via add_memory
-        # This function is kept for backward compatibility
+        return None
+    codes = agent.embedding_codes()
+    return MemorySnapshot(agent.name, agent.memory, agent.memory[:], codes,
+                          agent.ann_index(), agent._ann_lock)
+
+
+def write_memories(snap: Optional[MemorySnapshot]) -> None:
+    """Write a snapshot to disk; safe to call off the agent's thread."""
+    if snap is None:
         return
+    # Append new memories to the sidecar; rewrite the snapshot only when
+    # the sidecar outgrows 10% of it or the list was trimmed/rolled up
+    name, memory, codes = snap.name, snap.memory, snap.codes
+    src, written, base = _SAVED.get(name, (None, 0, 0))
+    if src is snap.source and written <= len(memory) and len(memory) - base <= base // 10:
+        _append_delta(name, memory, codes, written)
     else:
-        data = [m.__dict__ for m in agent.memory]
-        with _path(agent.name).open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _write_snapshot(name, memory, codes)
+        base = len(memory)
+    _SAVED[name] = (snap.source, len(memory), base)
+    if snap.ann is not None:
+        with snap.ann_lock:  # the agent may be adding to (or resizing) the graph
+            if snap.ann.get_current_count() == len(codes):
+                save_ann_index(name, snap.ann, codes)
+
+
+def save_memories(agent: "Agent") -> None:  # quotes avoid runtime eval
+    """Persist *agent*'s memories now, on the calling thread."""
+    write_memories(snapshot_memories(agent))
+
+
+def _load_delta(name: str, base: int, dim: int):
+    """Return ``(records, int8 rows)`` appended after a snapshot of *base* rows."""
+    p = _delta_path(name)
+    if not p.exists():
+        return [], None
+    records, skip = [], 0
+    for line in p.read_bytes().splitlines():
+        try:
+            rec = orjson.loads(line)
+        except orjson.JSONDecodeError:  # torn last line after a crash
+            break
+        if rec.pop("i", base) < base:
+            skip += 1
+        else:
+            records.append(rec)
+    e = _emb_delta_path(name)
+    if not dim or not e.exists():
+        return records, None
+    raw = np.fromfile(e, dtype=np.int8)
+    rows = raw[: len(raw) // dim * dim].reshape(-1, dim)[skip:skip + len(records)]
+    return records, rows if len(rows) == len(records) else None
 
 
-def load_memories(name: str) -> List["Memory"]:
+def save_ann_index(name: str, index, codes: np.ndarray) -> None:
+    """Save *index* (built over exactly *codes*) with a fingerprint of *codes*."""
+    path = _ann_path(name)
+    tmp = path.with_name(path.name + ".tmp")
+    index.save_index(str(tmp))
+    os.replace(tmp, path)
+    _write_atomic(path.with_suffix(".sha256"), _fingerprint(codes))
+
+
+def load_ann_index(name: str, codes: np.ndarray):
+    """Return the saved HNSW index for *name* if it was built over *codes*, else None."""
+    path = _ann_path(name)
+    stamp = path.with_suffix(".sha256")
+    try:
+        if not path.exists() or stamp.read_bytes() != _fingerprint(codes):
+            return None
+        import hnswlib
+        index = hnswlib.Index(space="ip", dim=codes.shape[1])
+        index.load_index(str(path), max_elements=max(2 * len(codes), 1024))
+    except Exception as e:  # missing stamp, hnswlib absent, corrupt file
+        print(f"[ANN load skipped] {e}")
+        return None
+    return index if index.get_current_count() == len(codes) else None
+
+
+def load_memories(name: str, *, remote: bool = True) -> List["Memory"]:
     """
     Lazy-import Memory *inside* the function to avoid circular imports.
     Called only after core.agent has finished initialising.
+
+    With ``remote=False`` only the local snapshot, sidecar and legacy JSON
+    are read, even when Mem0 is configured.
     """
     from .agent import Memory   # deferred import – safe now
     data = []
-    if _use_remote():
+    if remote and _use_remote():
         try:
             # Get memories from Mem0 Pro
             params = {"user_id": name.lower()}
@@ -84,7 +290,7 @@ def load_memories(name: str) -> List["Memory"]:
             if MEM0_PROJECT_ID:
                 params["project_id"] = MEM0_PROJECT_ID
             
-            r = requests.get(_remote_url(name), headers=_remote_headers(), params=params, timeout=30)
+            r = _session().get(_remote_url(name), headers=_remote_headers(), params=params, timeout=_TIMEOUT)
             r.raise_for_status()
             response_data = r.json()
             
@@ -103,10 +309,29 @@ def load_memories(name: str) -> List["Memory"]:
             print(f"[Mem0 load error] {e}")
     
     if not data:
-        p = _path(name)
+        p, legacy = _path(name), _legacy_path(name)
         if p.exists():
-            with p.open("r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = orjson.loads(gzip.decompress(p.read_bytes()))
+        elif legacy.exists():
+            data = orjson.loads(legacy.read_bytes())
+        # Older files keep embeddings inline; newer ones store them quantised
+        e = _emb_path(name)
+        codes = None
+        if data and "embedding" not in data[0] and e.exists():
+            codes = np.load(e, mmap_mode="r")  # paged in, never parsed
+            if len(codes) != len(data):
+                codes = None
+        # Memories appended since the snapshot live in the JSONL sidecar
+        base = len(data)
+        extra, rows = _load_delta(name, base, codes.shape[1] if codes is not None else 0)
+        data.extend(extra)
+        if codes is not None and rows is not None:
+            codes = np.concatenate([codes, rows])
+        if codes is not None and len(codes) == len(data):
+            from .agent import EMB_SCALE
+            embs = codes.astype(np.float32) / EMB_SCALE  # one vectorised decode
+            for d, emb in zip(data, embs):
+                d["embedding"] = emb  # float32 row, stacked as-is by the agent
     return [Memory(**d) for d in data]
 
 
@@ -121,7 +346,7 @@ def llm_summarise_block(
         headers = {"Authorization": f"Bearer {MEM0_API_KEY}", "Content-Type": "application/json"}
         payload = {"text": block, "agent": agent_name}
         try:
-            r = requests.post(f"{_BASE_URL}/summarize", json=payload, headers=headers, timeout=30)
+            r = _session().post(f"{_BASE_URL}/summarize", json=payload, headers=headers, timeout=_TIMEOUT)
             r.raise_for_status()
             return r.json().get("summary", "")
         except Exception as e:
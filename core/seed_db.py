@@ -1,15 +1,64 @@
 from __future__ import annotations
+import os
 import sqlite3
+import threading
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, List, Union
 
 DB_PATH = Path("seed_data.db")
 
+# One connection per (thread, database), opened and configured once
+_local = threading.local()
+
+# Fixed SQL text, so each connection's statement cache compiles it once
+_SELECT_SEEDS = "SELECT text FROM seeds WHERE agent=? ORDER BY id"
+
+# Read-only lookups are served from an in-memory copy of each database,
+# taken on first lookup and dropped when `init_db` writes to it
+_mirrors: Dict[str, sqlite3.Connection] = {}
+_mirror_lock = threading.Lock()
+_mirror_pid = os.getpid()
+
+
+def _get_conn(path: Path) -> sqlite3.Connection:
+    """Return this thread's connection to *path*, opening it on first use."""
+    # Reopen after a fork: SQLite connections must not cross processes
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.conns, _local.pid = {}, os.getpid()
+    conns: Dict[str, sqlite3.Connection] = _local.conns
+    key = str(path.resolve())
+    conn = conns.get(key)
+    if conn is None:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")  # seed data is regenerable
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+        conn.execute("PRAGMA cache_spill=0")  # keep dirty pages in that cache
+        conns[key] = conn
+    return conn
+
+
+def _mirror(path: Path) -> sqlite3.Connection:
+    """Return the in-memory copy of *path*; call with `_mirror_lock` held."""
+    global _mirror_pid
+    if _mirror_pid != os.getpid():
+        _mirrors.clear()  # the parent's copies must not cross a fork
+        _mirror_pid = os.getpid()
+    key = str(path.resolve())
+    mem = _mirrors.get(key)
+    if mem is None:
+        mem = sqlite3.connect(":memory:", check_same_thread=False)
+        _get_conn(path).backup(mem)
+        _mirrors[key] = mem
+    return mem
+
 
 def init_db(path: Union[str, Path] = DB_PATH) -> None:
     """Create the seeds table and insert dummy data if none exist."""
     path = Path(path)
-    with sqlite3.connect(path) as conn:
+    conn = _get_conn(path)
+    with conn:
         cur = conn.cursor()
         cur.execute(
             """CREATE TABLE IF NOT EXISTS seeds (
@@ -18,7 +67,8 @@ def init_db(path: Union[str, Path] = DB_PATH) -> None:
                 text TEXT NOT NULL
             )"""
         )
-        conn.commit()
+        # Per-agent lookups read the index in id order: no scan, no sort
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_seeds_agent ON seeds(agent, id)")
         cur.execute("SELECT COUNT(*) FROM seeds")
         if cur.fetchone()[0] == 0:
             sample = [
@@ -30,7 +80,10 @@ def init_db(path: Union[str, Path] = DB_PATH) -> None:
             cur.executemany(
                 "INSERT INTO seeds(agent, text) VALUES(?, ?)", sample
             )
-            conn.commit()
+    with _mirror_lock:
+        stale = _mirrors.pop(str(path.resolve()), None)
+    if stale is not None:
+        stale.close()
 
 
 def load_seed_memories(
@@ -43,8 +96,5 @@ def load_seed_memories(
     if not path.exists():
         return []
     agent = agent.lower()
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT text FROM seeds WHERE agent=? ORDER BY id", (agent,))
-        rows = cur.fetchall()
-    return [r[0] for r in rows]
+    with _mirror_lock:  # the mirror is one connection shared by all threads
+        return [r[0] for r in _mirror(path).execute(_SELECT_SEEDS, (agent,))]
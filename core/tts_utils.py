@@ -6,19 +6,49 @@ Keeps all voice-specific networking in one place.
 from __future__ import annotations
 import os
 import asyncio
+import concurrent.futures
+import contextlib
 import json
 import base64
+import queue
 import ssl
+import threading
+import time
 import websockets
+from websockets.sync.client import connect as ws_connect
 try:
     import requests
 except ModuleNotFoundError:  # allow tests without requests
     requests = None
+from collections import OrderedDict
 from uuid import uuid4
-from typing import Optional, AsyncGenerator, Dict, Any
+from typing import Optional, AsyncGenerator, Dict, Any, Callable, Iterable, Iterator
+
+import numpy as np
 
 # API key - load from centralized config
 from config import ELEVEN_API_KEY
+from .background import per_process
+
+# Keep-alive sessions for ElevenLabs REST calls, one per thread so
+# concurrent speak() calls never share connection state
+_local = threading.local()
+
+
+def _http() -> "requests.Session":
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+# TLS contexts are built once: creating one loads the system trust store.
+# The realtime session has always skipped verification (macOS Pythons often
+# lack a CA bundle); the sync stream path keeps default verification.
+_SSL_CTX = ssl.create_default_context()
+_SSL_CTX.check_hostname = False
+_SSL_CTX.verify_mode = ssl.CERT_NONE
+_VERIFIED_SSL_CTX = ssl.create_default_context()
 
 
 class ElevenLabsRealtimeSession:
@@ -29,6 +59,7 @@ class ElevenLabsRealtimeSession:
         self.api_key = api_key or ELEVEN_API_KEY
         self.websocket: Optional[websockets.WebSocketClientProtocol] = None
         self.is_connected = False
+        self.completed = False  # last stream ended normally (not error/timeout)
         
     async def connect(self) -> None:
         """Establish WebSocket connection to ElevenLabs Realtime API."""
@@ -41,13 +72,8 @@ class ElevenLabsRealtimeSession:
         
         # Connecting to WebSocket
         try:
-            # Create SSL context for macOS compatibility
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            
             self.websocket = await websockets.connect(
-                url, additional_headers=headers, ping_interval=20, ping_timeout=10, ssl=ssl_context
+                url, additional_headers=headers, ping_interval=20, ping_timeout=10, ssl=_SSL_CTX
             )
             # Connected
             await self._configure_session()
@@ -83,6 +109,7 @@ class ElevenLabsRealtimeSession:
             "try_trigger_generation": True
         }
         # Sending text
+        self.completed = False
         await self.websocket.send(json.dumps(message))
         
         # Send end-of-input signal
@@ -111,6 +138,7 @@ class ElevenLabsRealtimeSession:
                         yield audio_bytes
                     if data.get("isFinal"):
                         # Stream ended
+                        self.completed = True
                         break
                     if "error" in data:
                         print(f"[TTS Error] {data['error']}")
@@ -123,6 +151,7 @@ class ElevenLabsRealtimeSession:
                 break
             except websockets.exceptions.ConnectionClosedOK:
                 # Stream complete
+                self.completed = True
                 break
             except websockets.exceptions.ConnectionClosed as e:
                 print(f"[TTS Error] Connection closed: {e}")
@@ -160,6 +189,7 @@ class RealtimeTTSManager:
     async def stream_tts(self, text: str, voice_id: str, job_id: str = None) -> AsyncGenerator[Dict[str, Any], None]:
         """Stream TTS with metadata for WebSocket transmission."""
         job_id = job_id or str(uuid4())
+        session = None
         
         try:
             session = await self.get_or_create_session(voice_id)
@@ -188,47 +218,38 @@ class RealtimeTTSManager:
         except Exception as e:
             print(f"[TTS Manager Error] {e}")
         finally:
-            yield {"type": "audio_end", "id": job_id}
-            if job_id in self.active_jobs:
-                del self.active_jobs[job_id]
+            self.active_jobs.pop(job_id, None)
+        # Not in `finally`: a generator closed early must not yield again
+        yield {"type": "audio_end", "id": job_id,
+               "complete": bool(session and session.completed)}
                 
-    def stream_tts_sync(self, text: str, voice_id: str, job_id: str = None):
-        """Synchronous wrapper for stream_tts that always runs in a separate thread."""
-        import asyncio
-        import concurrent.futures
-        
-        def run_in_isolated_thread():
-            """Run the async TTS streaming in a completely isolated thread with new manager."""
-            # Create a new event loop for this thread
-            new_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(new_loop)
-            
+    def stream_tts_sync(self, text: str, voice_id: str, job_id: str = None) -> Iterator[Dict[str, Any]]:
+        """Synchronous wrapper for stream_tts, run on the shared TTS loop.
+
+        Chunks are yielded as they arrive, not after synthesis finishes.
+        Must not be iterated on the TTS loop's own thread (it would wait on
+        itself); closing the iterator early cancels the stream.
+        """
+        chunks: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def pump():
+            # ElevenLabs closes the socket after each end-of-input, so every
+            # call gets its own session; the loop and its thread are reused
+            job_manager = RealtimeTTSManager()
             try:
-                async def collect_chunks():
-                    # Create a completely new TTS manager instance for this thread
-                    # This avoids sharing WebSocket sessions across event loops
-                    isolated_manager = RealtimeTTSManager()
-                    
-                    chunks = []
-                    async for chunk in isolated_manager.stream_tts(text, voice_id, job_id):
-                        chunks.append(chunk)
-                    
-                    # Clean up the isolated manager's sessions
-                    await isolated_manager.close_all()
-                    return chunks
-                
-                # Run the async function in the new loop
-                return new_loop.run_until_complete(collect_chunks())
+                async with contextlib.aclosing(job_manager.stream_tts(text, voice_id, job_id)) as packets:
+                    async for chunk in packets:
+                        chunks.put(chunk)
             finally:
-                # Clean up the loop
-                new_loop.close()
-                asyncio.set_event_loop(None)
-        
-        # Always run in a separate thread to avoid any loop conflicts
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(run_in_isolated_thread)
-            chunks = future.result()
-            return iter(chunks)
+                await job_manager.close_all()
+                chunks.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), get_tts_loop())
+        try:
+            yield from iter(chunks.get, done)
+        finally:
+            future.cancel()
     
     async def cancel_job(self, job_id: str) -> bool:
         """Cancel an active TTS job."""
@@ -247,39 +268,240 @@ class RealtimeTTSManager:
         self.active_jobs.clear()
 
 
-# Global TTS manager instance
-_tts_manager = None
+# Encodings the /ws endpoint can deliver; the source is always 22.05 kHz PCM
+PCM_ENCODINGS = ("pcm_s16le", "pcm_mulaw")
 
-def get_tts_manager() -> RealtimeTTSManager:
-    """Get the global TTS manager instance."""
-    global _tts_manager
-    if _tts_manager is None:
-        _tts_manager = RealtimeTTSManager()
-    return _tts_manager
 
+def pcm16_to_ulaw(pcm: bytes) -> bytes:
+    """G.711 µ-law encode little-endian 16-bit PCM (matches audioop.lin2ulaw)."""
+    x = np.frombuffer(pcm, dtype="<i2").astype(np.int32) >> 2
+    mask = np.where(x < 0, 0x7F, 0xFF)
+    v = np.minimum(np.abs(x), 8159) + 0x21
+    seg = np.frexp(v)[1] - 6
+    u = np.where(seg > 7, 0x7F, (seg << 4) | ((v >> (seg + 1)) & 0x0F))
+    return (u ^ mask).astype(np.uint8).tobytes()
 
-# Legacy synchronous helper (backward compatibility)
-def speak(text: str, voice_id: str, *, playback_cmd: str = "afplay") -> None:
+
+def pcm_encoder(encoding: str) -> Callable[[bytes], bytes]:
+    """Return a per-stream converter from raw PCM chunks to *encoding*."""
+    if encoding != "pcm_mulaw":
+        return lambda chunk: chunk
+
+    carry = b""  # odd trailing byte of a sample split across chunks
+
+    def encode(chunk: bytes) -> bytes:
+        nonlocal carry
+        data = carry + chunk if carry else chunk
+        cut = len(data) & ~1
+        carry = data[cut:]
+        return pcm16_to_ulaw(data[:cut])
+    return encode
+
+
+class AudioCache:
+    """Small LRU of rendered audio keyed by ``(text, voice_id)``.
+
+    Bounded both by entry count and total bytes.  Only touched from the TTS
+    loop thread, so it needs no lock.
     """
-    Download TTS audio from ElevenLabs and play it via *playback_cmd*.
-    No-ops if keys or voice_id are missing.
+
+    def __init__(self, max_items: int = 200, max_bytes: int = 256 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        audio = self._data.get(key)
+        if audio is not None:
+            self._data.move_to_end(key)
+        return audio
+
+    def put(self, key: tuple, audio: bytes) -> None:
+        if len(audio) > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._data[key] = audio
+        self._bytes += len(audio)
+        while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._bytes -= len(evicted)
+
+
+# Shared event loop for WebSocket TTS jobs, started on first use per process
+@per_process
+def get_tts_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop that runs TTS streaming coroutines."""
+    try:
+        import uvloop  # optional, faster loop implementation
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="tts-loop", daemon=True).start()
+    return loop
+
+
+def stream_speech(
+    text_chunks: Iterable[str],
+    voice_id: str,
+    *,
+    output_format: str = "mp3_44100_128",
+) -> Iterator[bytes]:
     """
-    if not ELEVEN_API_KEY or not voice_id or not requests:
-        print("[TTS disabled – set ELEVEN_API_KEY / ELEVENLABS_API_KEY and voice ID]")
+    Voice *text_chunks* over ElevenLabs' stream-input WebSocket and yield
+    encoded audio as it arrives.
+
+    Text is sent from a helper thread while this generator drains audio, so
+    an LLM token/sentence stream can be piped straight in and the first audio
+    frames come back before the reply is finished.
+    """
+    if not _tts_available(voice_id):
         return
 
+    url = (f"wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+           f"/stream-input?output_format={output_format}")
+    start = time.perf_counter()
+    with ws_connect(url, additional_headers={"xi-api-key": ELEVEN_API_KEY}, ssl=_VERIFIED_SSL_CTX) as ws:
+        # BOS: voice settings, then text, then an empty string to flush/close
+        ws.send(json.dumps({
+            "text": " ",
+            "voice_settings": {"stability": 0.55, "similarity_boost": 0.8},
+            "xi_api_key": ELEVEN_API_KEY,
+        }))
+
+        def send_text() -> None:
+            try:
+                for chunk in text_chunks:
+                    if chunk.strip():
+                        ws.send(json.dumps({"text": chunk.rstrip() + " ",
+                                            "try_trigger_generation": True}))
+            except Exception as e:
+                print(f"[TTS Stream Error] {e}")
+            finally:
+                try:
+                    ws.send(json.dumps({"text": ""}))
+                except websockets.exceptions.ConnectionClosed:
+                    pass
+
+        sender = threading.Thread(target=send_text, daemon=True)
+        sender.start()
+
+        first = True
+        for message in ws:
+            data = json.loads(message)
+            if data.get("audio"):
+                if first:
+                    print(f"[TTS] First audio byte after {time.perf_counter() - start:.3f}s")
+                    first = False
+                yield base64.b64decode(data["audio"])
+            if data.get("isFinal"):
+                break
+            if "error" in data:
+                print(f"[TTS Error] {data['error']}")
+                break
+        sender.join(timeout=1.0)
+
+
+# Legacy synchronous helper (backward compatibility)
+def _synthesize(text: str, voice_id: str) -> Optional[str]:
+    """Download TTS audio for *text* to a temp mp3 file and return its path."""
     url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
     headers = {"xi-api-key": ELEVEN_API_KEY, "Content-Type": "application/json"}
     body = {"text": text,
             "voice_settings": {"stability": 0.55, "similarity_boost": 0.8}}
 
-    r = requests.post(url, json=body, headers=headers, timeout=30)
+    r = _http().post(url, json=body, headers=headers, timeout=30)
     if r.status_code != 200:
         print("[TTS error]", r.text)
-        return
+        return None
 
     fname = f"audio_{uuid4()}.mp3"
     with open(fname, "wb") as f:
         f.write(r.content)
+    return fname
+
+
+def _play(fname: str, playback_cmd: str) -> None:
     os.system(f"{playback_cmd} {fname}")
     os.remove(fname)
+
+
+def _tts_available(voice_id: str) -> bool:
+    if not ELEVEN_API_KEY or not voice_id or not requests:
+        print("[TTS disabled – set ELEVEN_API_KEY / ELEVENLABS_API_KEY and voice ID]")
+        return False
+    return True
+
+
+def probe_voice(voice_id: str) -> bool:
+    """
+    Check once that the API key and *voice_id* are usable, without spending
+    characters on synthesis (looks the voice up instead).
+    """
+    if not _tts_available(voice_id):
+        return False
+    try:
+        r = requests.get(f"https://api.elevenlabs.io/v1/voices/{voice_id}",
+                         headers={"xi-api-key": ELEVEN_API_KEY}, timeout=5)
+    except Exception as e:
+        print(f"[TTS probe error] {e}")
+        return False
+    if r.status_code != 200:
+        print("[TTS probe error]", r.status_code, r.text[:200])
+        return False
+    return True
+
+
+def speak(text: str, voice_id: str, *, playback_cmd: str = "afplay") -> None:
+    """
+    Download TTS audio from ElevenLabs and play it via *playback_cmd*.
+    No-ops if keys or voice_id are missing.
+    """
+    if not _tts_available(voice_id):
+        return
+
+    fname = _synthesize(text, voice_id)
+    if fname:
+        _play(fname, playback_cmd)
+
+
+class SpeechQueue:
+    """Speak sentences as they arrive: synthesise in parallel, play in order.
+
+    Each `put` submits synthesis to a small worker pool right away, so later
+    sentences render while earlier ones are still playing; a single player
+    thread consumes the futures FIFO so playback order matches input order.
+    """
+
+    def __init__(self, voice_id: str, *, playback_cmd: str = "afplay", max_workers: int = 3):
+        self.voice_id = voice_id
+        self.playback_cmd = playback_cmd
+        self.enabled = _tts_available(voice_id)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._pending: "queue.Queue[Optional[concurrent.futures.Future]]" = queue.Queue()
+        self._player = threading.Thread(target=self._play_loop, daemon=True)
+        self._player.start()
+
+    def put(self, text: str) -> None:
+        """Queue *text* for synthesis and eventual playback."""
+        if self.enabled and text.strip():
+            self._pending.put(self._pool.submit(_synthesize, text, self.voice_id))
+
+    def close(self, wait: bool = False) -> None:
+        """Stop accepting text; optionally block until everything has played."""
+        self._pending.put(None)
+        self._pool.shutdown(wait=False)
+        if wait:
+            self._player.join()
+
+    def _play_loop(self) -> None:
+        for future in iter(self._pending.get, None):
+            try:
+                fname = future.result()
+            except Exception as e:
+                print(f"[TTS error] {e}")
+                continue
+            if fname:
+                _play(fname, self.playback_cmd)
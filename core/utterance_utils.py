@@ -5,8 +5,9 @@ or catchphrases. They guide delivery, phrasing, and rhythm only."""
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Iterable, Iterator, Optional
 import json
+import re
 
 from . import llm_utils
 from router import pick_model
@@ -103,18 +104,17 @@ def load_transcript(name: str) -> str:
     return ""
 
 
-def generate_utterance(
+def _build_request(
     *,
     agent_name: str,
     personality: str,
     user_msg: str,
     relevant: str,
     graph_info: str,
-    model: str = "gpt-4o-mini",
-    temperature: float = 0.5,
-    mode: str = "conversation",
-) -> str:
-    """Generate a reply in the style of *agent_name*, referencing transcripts."""
+    temperature: float,
+    mode: str,
+) -> Dict[str, Any]:
+    """Assemble the system prompt and model settings shared by both reply paths."""
     transcript = load_transcript(agent_name)
     
     # Check for fixation patterns in recent memories
@@ -163,14 +163,110 @@ def generate_utterance(
     if cfg["model"].startswith("gpt-5"):
         temperature = 1.0
     
-    answer = llm_utils.chat(
-        [{"role": "system", "content": prompt}],
-        model=cfg["model"],
+    return {
+        "messages": [{"role": "system", "content": prompt}],
+        "model": cfg["model"],
+        "temperature": temperature,
+        "max_completion_tokens": cfg["max_completion_tokens"],
+    }
+
+
+def generate_utterance(
+    *,
+    agent_name: str,
+    personality: str,
+    user_msg: str,
+    relevant: str,
+    graph_info: str,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.5,
+    mode: str = "conversation",
+) -> str:
+    """Generate a reply in the style of *agent_name*, referencing transcripts."""
+    request = _build_request(
+        agent_name=agent_name,
+        personality=personality,
+        user_msg=user_msg,
+        relevant=relevant,
+        graph_info=graph_info,
         temperature=temperature,
-        max_completion_tokens=cfg["max_completion_tokens"],
+        mode=mode,
     )
+    answer = llm_utils.chat(request.pop("messages"), **request)
     cleaned = answer.lstrip() if answer else ""
     prefix = f"{agent_name}:"
     if cleaned.lower().startswith(prefix.lower()):
         cleaned = cleaned[len(prefix):].lstrip()
     return cleaned
+
+
+def generate_utterance_stream(
+    *,
+    agent_name: str,
+    personality: str,
+    user_msg: str,
+    relevant: str,
+    graph_info: str,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.5,
+    mode: str = "conversation",
+) -> Iterator[str]:
+    """Streaming variant of :func:`generate_utterance` that yields text deltas.
+
+    A leading ``"<agent_name>:"`` echoed by the model is stripped, which means
+    the first few tokens are held back until the prefix can be ruled out.
+    """
+    request = _build_request(
+        agent_name=agent_name,
+        personality=personality,
+        user_msg=user_msg,
+        relevant=relevant,
+        graph_info=graph_info,
+        temperature=temperature,
+        mode=mode,
+    )
+    prefix = f"{agent_name}:".lower()
+    head = ""
+    checking = True
+    for delta in llm_utils.chat_stream(request.pop("messages"), **request):
+        if not checking:
+            yield delta
+            continue
+        head = (head + delta).lstrip()
+        if len(head) < len(prefix) and prefix.startswith(head.lower()):
+            continue
+        checking = False
+        if head.lower().startswith(prefix):
+            head = head[len(prefix):].lstrip()
+        if head:
+            yield head
+    if checking and head:
+        yield head
+
+
+_SENTENCE_END = re.compile(r"[.?!][\"')\]]*\s+")
+
+
+def iter_sentences(deltas: Iterable[str], *, max_words: int = 80) -> Iterator[str]:
+    """Regroup streamed text *deltas* into sentence-sized chunks.
+
+    A chunk is emitted as soon as a ``.``/``?``/``!`` boundary followed by
+    whitespace is seen, or when the pending text grows past *max_words* so very
+    long sentences don't hold back speech.  Any remainder is flushed at the end.
+    """
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        last_end = None
+        for last_end in _SENTENCE_END.finditer(buffer):
+            pass
+        if last_end is not None:
+            sentence, buffer = buffer[:last_end.end()].strip(), buffer[last_end.end():]
+            if sentence:
+                yield sentence
+        elif len(buffer.split()) > max_words:
+            sentence, _, buffer = buffer.rpartition(" ")
+            if sentence.strip():
+                yield sentence.strip()
+    if buffer.strip():
+        yield buffer.strip()
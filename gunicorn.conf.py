@@ -0,0 +1,38 @@
+"""Gunicorn settings for serving AugTwins.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5001")
+
+# Conversation history and the active agent live in module globals, so each
+# worker process has its own copy.  One worker keeps sessions consistent;
+# raise WEB_CONCURRENCY (e.g. 2*CPU+1) only once that state moves to a shared
+# store (e.g. Redis) or clients don't rely on it.
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# Threads overlap LLM/TTS network waits; each open /ws socket holds one
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Import the app once in the master (when_ready then imports the embedding
+# stack); workers share those pages copy-on-write after fork
+preload_app = True
+timeout = 60
+
+
+def when_ready(server):
+    """Import the embedding libraries in the master before forking."""
+    # Import only: building the model starts torch/ONNX Runtime thread pools
+    # and loading memories may open Mem0 sockets, and neither survives a fork
+    try:
+        import sentence_transformers  # noqa: F401
+    except ModuleNotFoundError:
+        pass
+
+
+def post_fork(server, worker):
+    """Load the default agent and warm its connections in each worker."""
+    from app import STATE, load_agent
+    load_agent(STATE.agent)
@@ -19,7 +19,16 @@ except ImportError:
     MEM0_AVAILABLE = False
     print("❌ Mem0 library not installed. Install with: pip install mem0ai")
 
+try:
+    import httpx  # Mem0's transport; tells connect failures apart from the rest
+except ImportError:
+    httpx = None
+
 from config import MEM0_API_KEY, MEM0_ORG_ID, MEM0_PROJECT_ID
+from core.memory_utils import load_memories
+
+# Memories per Mem0 add() request during sync
+BATCH_SIZE = 20
 
 def validate_config():
     """Check if Mem0 credentials are configured and library is available."""
@@ -95,17 +104,16 @@ def categorize_memory(text: str) -> Dict[str, any]:
         return {"type": "general", "tags": ["general"]}
 
 def load_local_memories(agent_name: str = "lars") -> List[Dict]:
-    """Load memories from local JSON file."""
-    memory_file = Path(f"memories/{agent_name}_memories.json")
-    
-    if not memory_file.exists():
-        print(f"❌ Local memory file not found: {memory_file}")
+    """Load the agent's local memories: snapshot, JSONL sidecar and legacy JSON."""
+    print(f"📂 Loading local memories for '{agent_name}'...")
+    memories = [
+        {"text": m.text, "timestamp": m.timestamp, "is_summary": m.is_summary}
+        for m in load_memories(agent_name, remote=False)
+    ]
+    if not memories:
+        print(f"❌ No local memories found for '{agent_name}'")
         return []
     
-    print(f"📂 Loading local memories from {memory_file}...")
-    with open(memory_file, 'r', encoding='utf-8') as f:
-        memories = json.load(f)
-    
     print(f"✅ Loaded {len(memories)} local memories")
     return memories
 
@@ -155,6 +163,35 @@ def upload_memory(text: str, user_id: str = "lars", metadata: Dict = None, clien
             print(f"   ❌ Error: {e}")
         return False
 
+def _never_sent(exc: BaseException) -> bool:
+    """True if *exc*, or an exception it wraps, shows the request never reached Mem0."""
+    while exc is not None:
+        if httpx is not None and isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+def upload_memories_batch(texts: List[str], user_id: str, metadata: Dict, client: MemoryClient) -> int:
+    """Upload several memories sharing *metadata* in one ``client.add`` call.
+
+    Mem0 extracts memories from the batch as one message list, not fact by
+    fact, so closely related facts may be merged. The batch is retried one
+    memory per request only if the connection failed before the request was
+    sent. After a timeout or an error response the server may already have
+    stored it, so it is counted as failed rather than uploaded twice.
+    Returns the number of memories uploaded.
+    """
+    try:
+        messages = [{"role": "user", "content": text} for text in texts]
+        client.add(messages, user_id=user_id, metadata=metadata)
+        return len(texts)
+    except Exception as e:
+        if not _never_sent(e):
+            print(f"   ❌ Batch upload failed ({e}); not retrying, it may have been stored")
+            return 0
+        print(f"   ⚠️  Batch upload failed to connect ({e}), retrying one by one...")
+        return sum(upload_memory(text, user_id, metadata, client) for text in texts)
+
 def main():
     """Main sync function."""
     import sys
@@ -260,44 +297,40 @@ def main():
         print("❌ Failed to initialize Mem0 client")
         return
     
-    for i, memory in enumerate(memories_to_upload, 1):
-        # Progress indicator
-        progress = (i / len(memories_to_upload)) * 100
-        print(f"  [{i}/{len(memories_to_upload)}] ({progress:.1f}%) Uploading...", end="")
-        
-        # Categorize the memory based on content
-        categorization = categorize_memory(memory["text"])
-        
-        # Prepare metadata following generate_profile.py format
-        metadata = {
-            "type": categorization["type"],
-            "tags": categorization["tags"],
-            "source": "local_sync",
-            "category": categorization["type"]  # Use type as category
-        }
-        
-        # Add timestamp if available
-        if memory.get("timestamp"):
-            metadata["timestamp"] = memory["timestamp"]
-        
-        # Handle summary memories specially
-        if memory.get("is_summary"):
-            metadata["type"] = "summary"
-            metadata["category"] = "summary"
-            metadata["tags"] = ["summary", "consolidated"]
-        
-        # Upload using the client
-        if upload_memory(memory["text"], agent_name, metadata, client):
-            success_count += 1
-            print(" ✅")
-        else:
-            fail_count += 1
-            print(" ❌")
-        
-        # Rate limiting pause every 20 uploads (like generate_profile.py)
-        if i % 20 == 0 and i < len(memories_to_upload):
-            print("  ⏸️  Pausing for rate limits...")
-            time.sleep(2)
+    # Memories sharing a category share metadata, so each group goes up in
+    # batches of BATCH_SIZE messages per request instead of one request each
+    batches: Dict[str, List[Dict]] = {}
+    for memory in memories_to_upload:
+        # Summary memories get their own group
+        key = "summary" if memory.get("is_summary") else categorize_memory(memory["text"])["type"]
+        batches.setdefault(key, []).append(memory)
+    
+    done = 0
+    for mem_type, group in batches.items():
+        for start in range(0, len(group), BATCH_SIZE):
+            batch = group[start:start + BATCH_SIZE]
+            done += len(batch)
+            
+            # Prepare metadata following generate_profile.py format
+            if mem_type == "summary":
+                tags = ["summary", "consolidated"]
+            else:
+                tags = categorize_memory(batch[0]["text"])["tags"]
+            metadata = {
+                "type": mem_type,
+                "tags": tags,
+                "source": "local_sync",
+                "category": mem_type  # Use type as category
+            }
+            
+            # Progress indicator
+            progress = (done / len(memories_to_upload)) * 100
+            print(f"  [{done}/{len(memories_to_upload)}] ({progress:.1f}%) Uploading {len(batch)} {mem_type} memories...", end="")
+            
+            uploaded = upload_memories_batch([m["text"] for m in batch], agent_name, metadata, client)
+            success_count += uploaded
+            fail_count += len(batch) - uploaded
+            print(" ✅" if uploaded == len(batch) else f" ⚠️  {uploaded}/{len(batch)}")
     
     # Final report
     print("\n" + "="*60)
@@ -0,0 +1,8 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py loads the default agent in each worker after fork.  With other
+servers, call ``app.load_agent(app.STATE.agent)`` once at startup.
+"""
+from app import app  # noqa: F401